@@ -0,0 +1,39 @@
+#!/usr/bin/python3
+"""Benchmark of the bulk insert path against saving object by object.
+
+Saves a sample of Places one at a time with BaseModel.save(), the way
+fixtures used to be loaded, then <count> Places (100000 by default) with
+a single storage.bulk_save(), and prints the throughput of both on the
+engine selected by HBNB_TYPE_STORAGE. FileStorage runs in a scratch
+directory; DBStorage writes to the database named by HBNB_MYSQL_*:
+
+    ~ $ python3 -m benchmarks.bench_bulk [count] [sample]
+"""
+import os
+import sys
+import tempfile
+from benchmarks.dataset import generate
+from benchmarks.dataset import timed
+
+
+def save_each(objs):
+    """Save objs one by one through BaseModel.save()."""
+    for obj in objs:
+        obj.save()
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    sample = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        import models
+        print("engine: {}".format(type(models.storage).__name__))
+        for name, size, run in (
+                ("save() each", sample, save_each),
+                ("bulk_save()", count, models.storage.bulk_save)):
+            objs = generate(states=1, cities=1, places=size, reviews=0,
+                            users=1, amenities=0)
+            seconds = timed(run, objs)
+            print("{:<12} {:>7} objects: {:8.3f}s {:>10.0f} objects/s".format(
+                name, len(objs), seconds, len(objs) / seconds))
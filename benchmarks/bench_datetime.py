@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+"""Micro-benchmark of timestamp parsing on the FileStorage reload path.
+
+Times parsing <count> timestamps with strptime() against parse_datetime(),
+then reloads a synthetic file.json of <count> objects once with each
+parser plugged into BaseModel. Run from the root of the project:
+
+    ~ $ python3 -m benchmarks.bench_datetime [count]
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+from uuid import uuid4
+from datetime import datetime
+import models.base_model
+from models.base_model import parse_datetime
+from models.engine.file_storage import FileStorage
+
+
+def strptime(value):
+    """Parse value the way BaseModel did before parse_datetime()."""
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f")
+
+
+def timed(function, *args):
+    """Return the seconds taken by one call of function(*args)."""
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def write_dataset(path, count):
+    """Write count State records to the JSON file path."""
+    stamp = datetime.utcnow().isoformat()
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"State." + i: {"id": i, "created_at": stamp,
+                                  "updated_at": stamp, "name": "California",
+                                  "__class__": "State"}
+                   for i in (str(uuid4()) for _ in range(count))}, file)
+
+
+def reload_with(parser):
+    """Reload file.json from scratch with parser building the timestamps."""
+    models.base_model.parse_datetime = parser
+    FileStorage._FileStorage__objects = {}
+    try:
+        return timed(FileStorage().reload)
+    finally:
+        models.base_model.parse_datetime = parse_datetime
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    stamps = [datetime.utcnow().isoformat()] * count
+    for name, parser in (("strptime", strptime),
+                         ("parse_datetime", parse_datetime)):
+        print("parse {:>9} x {}: {:.3f}s".format(
+            count, name, timed(lambda: [parser(s) for s in stamps])))
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        write_dataset("file.json", count)
+        for name, parser in (("strptime", strptime),
+                             ("parse_datetime", parse_datetime)):
+            print("reload {:>8} x {}: {:.3f}s".format(
+                count, name, reload_with(parser)))
@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+"""Query plans and timings of the DBStorage hot queries, with and without
+the indexes declared on the models.
+
+Builds the schema from the models in two in-memory SQLite databases, a
+stand-in for MySQL, drops every declared index from one of them, fills
+both with the same rows, then prints EXPLAIN QUERY PLAN and the best of
+five runs of each query on both. Run from the root of the project:
+
+    ~ $ python3 -m benchmarks.bench_indexes [states]
+"""
+import sys
+from datetime import datetime
+from datetime import timedelta
+from uuid import uuid4
+from sqlalchemy import create_engine
+from sqlalchemy import insert
+from sqlalchemy import text
+from benchmarks.dataset import timed
+from models.base_model import Base
+
+QUERIES = (
+    ("cities of a state by name",
+     "SELECT * FROM cities WHERE state_id = :state_id ORDER BY name"),
+    ("places of a city in a price range",
+     "SELECT * FROM places WHERE city_id = :city_id"
+     " AND price_by_night BETWEEN 50 AND 150"),
+    ("page of places after a cursor",
+     "SELECT * FROM places WHERE (created_at, id) > (:created_at, :id)"
+     " ORDER BY created_at, id LIMIT 100"),
+    ("places of a user",
+     "SELECT * FROM places WHERE user_id = :user_id"),
+    ("reviews of a place",
+     "SELECT * FROM reviews WHERE place_id = :place_id"),
+    ("user by email",
+     "SELECT * FROM users WHERE email = :email"),
+    ("states by name",
+     "SELECT * FROM states ORDER BY name LIMIT 100"),
+)
+
+
+def rows(states, cities=20, places=20, reviews=2, users=1000):
+    """Return the rows of each table, as {table name: [row dict]}."""
+    now = datetime(2017, 1, 1)
+    data = {"states": [], "cities": [], "users": [], "places": [],
+            "reviews": []}
+
+    def row(table, **values):
+        values.update(id=str(uuid4()),
+                      created_at=now + timedelta(seconds=len(data[table])),
+                      updated_at=now)
+        data[table].append(values)
+        return values
+
+    for u in range(users):
+        row("users", email="user{}@hbnb.io".format(u), password="pwd")
+    for s in range(states):
+        state = row("states", name="State {}".format(s))
+        for c in range(cities):
+            city = row("cities", name="City {}".format(c),
+                       state_id=state["id"])
+            for p in range(places):
+                n = len(data["places"])
+                place = row("places", name="Place {}".format(n),
+                            city_id=city["id"],
+                            user_id=data["users"][n % users]["id"],
+                            price_by_night=n % 300)
+                for r in range(reviews):
+                    row("reviews", text="Review", place_id=place["id"],
+                        user_id=data["users"][r % users]["id"])
+    return data
+
+
+def database(data, indexed):
+    """Return an in-memory SQLite engine holding data."""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        if not indexed:
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    conn.execute(text("DROP INDEX {}".format(index.name)))
+        for name in ("states", "cities", "users", "places", "reviews"):
+            conn.execute(insert(Base.metadata.tables[name]), data[name])
+        conn.execute(text("ANALYZE"))
+    return engine
+
+
+if __name__ == "__main__":
+    states = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    data = rows(states)
+    middle = data["places"][len(data["places"]) // 2]
+    params = {"state_id": data["states"][-1]["id"],
+              "city_id": data["cities"][-1]["id"],
+              "created_at": middle["created_at"], "id": middle["id"],
+              "user_id": data["users"][-1]["id"],
+              "place_id": data["places"][-1]["id"],
+              "email": data["users"][-1]["email"]}
+    print(", ".join("{} {}".format(len(v), k) for k, v in data.items()))
+    engines = (("without indexes", database(data, False)),
+               ("with indexes", database(data, True)))
+    for title, sql in QUERIES:
+        print("\n" + title)
+        for label, engine in engines:
+            with engine.connect() as conn:
+                plan = conn.execute(text("EXPLAIN QUERY PLAN " + sql),
+                                    params).fetchall()
+                best = min(timed(lambda: conn.execute(text(sql),
+                                                      params).fetchall())
+                           for _ in range(5))
+            print("  {:<16} {:9.3f} ms  {}".format(
+                label, best * 1000, " / ".join(step[-1] for step in plan)))
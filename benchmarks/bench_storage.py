@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+"""Benchmark suite for the storage engines and the model hot paths.
+
+Builds a synthetic dataset (States -> Cities -> Places -> Reviews, plus
+Users and Amenities) and times new(), save(), reload(), all(cls), the
+relationship properties and to_dict() on the engine selected by
+HBNB_TYPE_STORAGE, the same way models/__init__.py picks it.
+
+Every object is changed before each timed save(), so each run writes
+(and FileStorage serializes) all of them. On DBStorage, "reload" times
+a new session followed by loading every row with all().
+
+FileStorage runs in a scratch directory. DBStorage writes to the
+database named by the HBNB_MYSQL_* variables, so point it at a test
+database. Results are printed, or written with --output, as one JSON
+document so they can be compared between releases:
+
+    ~ $ python3 -m benchmarks.bench_storage --states 20 --output out.json
+"""
+import os
+import sys
+import json
+import platform
+import tempfile
+from datetime import datetime
+from argparse import ArgumentParser
+from benchmarks.dataset import generate
+from benchmarks.dataset import timed
+
+
+def run(args):
+    """Time every storage operation and return the results as a dict."""
+    import models
+    from models.engine.file_storage import FileStorage
+    from models.place import Place
+    from models.state import State
+
+    storage = models.storage
+    objs = generate(args.states, args.cities, args.places, args.reviews,
+                    args.users, args.amenities)
+    results = {}
+
+    def record(name, seconds, ops):
+        """Keep the best of args.repeat timings of one operation."""
+        best = results.get(name)
+        if best is None or seconds < best["seconds"]:
+            results[name] = {"seconds": round(seconds, 6), "ops": ops,
+                             "us_per_op": round(seconds * 1e6 / max(ops, 1),
+                                                3)}
+
+    def new_all():
+        for obj in objs:
+            storage.new(obj)
+
+    def touch_all():
+        for obj in objs:
+            obj.updated_at = datetime.utcnow()
+
+    def load_all():
+        storage.reload()
+        storage.all()
+
+    record("new", timed(new_all), len(objs))
+    for _ in range(args.repeat):
+        touch_all()
+        record("save", timed(storage.save), len(objs))
+    for _ in range(args.repeat):
+        if type(storage) == FileStorage:
+            FileStorage._FileStorage__objects = {}
+            record("reload", timed(storage.reload), len(objs))
+        else:
+            storage.close()
+            storage._DBStorage__cache.clear()
+            record("reload", timed(load_all), len(objs))
+    for _ in range(args.repeat):
+        for cls in ("State", "City", "User", "Place", "Review", "Amenity"):
+            seconds = timed(storage.all, cls)
+            record("all({})".format(cls), seconds,
+                   len(storage.all(cls)))
+    states = list(storage.all(State).values())
+    places = list(storage.all(Place).values())
+    for _ in range(args.repeat):
+        record("State.cities", timed(
+            lambda: [len(s.cities) for s in states]), len(states))
+        record("Place.reviews", timed(
+            lambda: [len(p.reviews) for p in places]), len(places))
+        record("Place.amenities", timed(
+            lambda: [len(p.amenities) for p in places]), len(places))
+    everything = list(storage.all().values())
+    for _ in range(args.repeat):
+        record("to_dict", timed(
+            lambda: [o.to_dict() for o in everything]), len(everything))
+    return results
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--states", type=int, default=10)
+    parser.add_argument("--cities", type=int, default=10,
+                        help="cities per state")
+    parser.add_argument("--places", type=int, default=10,
+                        help="places per city")
+    parser.add_argument("--reviews", type=int, default=5,
+                        help="reviews per place")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--amenities", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per operation, the best one is kept")
+    parser.add_argument("--output", help="write the JSON results here")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    scale = {k: v for k, v in vars(args).items() if k != "output"}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        results = run(args)
+        import models
+        report = {"engine": type(models.storage).__name__,
+                  "python": platform.python_version(),
+                  "env": {k: v for k, v in os.environ.items()
+                          if k.startswith("HBNB_") and "PWD" not in k},
+                  "scale": scale,
+                  "results": results}
+    if output:
+        with open(output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+"""Builds synthetic HBnB datasets for the benchmarks.
+
+The models are imported when a dataset is built rather than at import
+time, so a benchmark can move to a scratch directory before models
+reloads any file.json it finds.
+"""
+import time
+
+
+def timed(function, *args):
+    """Return the seconds taken by one call of function(*args)."""
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def generate(states=10, cities=10, places=10, reviews=5, users=100,
+             amenities=20, amenities_per_place=3):
+    """Return a list of new, unsaved model instances.
+
+    The objects come parent first: Users and Amenities, then for each
+    State its Cities, their Places and the Places' Reviews.
+
+    Args:
+        states (int): The number of States.
+        cities (int): The number of Cities per State.
+        places (int): The number of Places per City.
+        reviews (int): The number of Reviews per Place.
+        users (int): The number of Users, owning Places and Reviews.
+        amenities (int): The number of Amenities.
+        amenities_per_place (int): The number of Amenities per Place.
+    """
+    import models
+    from models.amenity import Amenity
+    from models.city import City
+    from models.place import Place
+    from models.review import Review
+    from models.state import State
+    from models.user import User
+    from models.engine.file_storage import FileStorage
+
+    file_mode = type(models.storage) == FileStorage
+    objs = [User(email="user{}@hbnb.io".format(i), password="pwd",
+                 first_name="First{}".format(i), last_name="Last")
+            for i in range(users)]
+    amenity_objs = [Amenity(name="Amenity {}".format(i))
+                    for i in range(amenities)]
+    objs.extend(amenity_objs)
+    count = 0
+    for s in range(states):
+        state = State(name="State {}".format(s))
+        objs.append(state)
+        for c in range(cities):
+            city = City(name="City {}-{}".format(s, c), state_id=state.id)
+            objs.append(city)
+            for p in range(places):
+                count += 1
+                place = Place(city_id=city.id,
+                              user_id=objs[count % max(users, 1)].id,
+                              name="Place {}".format(count),
+                              number_rooms=count % 5, number_bathrooms=1,
+                              max_guest=count % 8 + 1,
+                              price_by_night=count % 300 + 20,
+                              latitude=37.0, longitude=-122.0)
+                linked = [amenity_objs[(count + i) % amenities]
+                          for i in range(min(amenities_per_place,
+                                             amenities))]
+                if file_mode:
+                    place.amenity_ids = [a.id for a in linked]
+                else:
+                    place.amenities = linked
+                objs.append(place)
+                for r in range(reviews):
+                    objs.append(Review(place_id=place.id,
+                                       user_id=objs[r % max(users, 1)].id,
+                                       text="Review {} of {}".format(
+                                           r, place.name)))
+    return objs
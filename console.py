@@ -1,6 +1,7 @@
 #!/usr/bin/python3
 """Defines the HBNB console."""
 import cmd
+import sys
 from shlex import split
 from models import storage
 from datetime import datetime
@@ -99,10 +100,9 @@ class HBNBCommand(cmd.Cmd):
                 raise NameError()
             if len(my_list) < 2:
                 raise IndexError()
-            objects = storage.all()
-            key = my_list[0] + '.' + my_list[1]
-            if key in objects:
-                print(objects[key])
+            obj = storage.get(my_list[0], my_list[1])
+            if obj is not None:
+                print(obj)
             else:
                 raise KeyError()
         except SyntaxError:
@@ -128,10 +128,9 @@ class HBNBCommand(cmd.Cmd):
                 raise NameError()
             if len(my_list) < 2:
                 raise IndexError()
-            objects = storage.all()
-            key = my_list[0] + '.' + my_list[1]
-            if key in objects:
-                del objects[key]
+            obj = storage.get(my_list[0], my_list[1])
+            if obj is not None:
+                storage.delete(obj)
                 storage.save()
             else:
                 raise KeyError()
@@ -147,23 +146,48 @@ class HBNBCommand(cmd.Cmd):
     def do_all(self, line):
         """Display string representations of all instances of a given class.
 
+        Usage: all [<class> [<page size> [<cursor>]]]
+        With a page size, only that many instances are shown, followed by
+        the cursor to pass back for the next page if there is one.
+
         Args:
             line (str): The input command line.
         """
         if not line:
-            o = storage.all()
-            print([o[k].__str__() for k in o])
+            self.print_list(storage.iter())
             return
         try:
             args = line.split(" ")
             if args[0] not in self.__classes:
                 raise NameError()
+            if len(args) > 1:
+                o, cursor = storage.page(args[0], int(args[1]),
+                                         args[2] if len(args) > 2 else None)
+                print([o[k].__str__() for k in o])
+                if cursor is not None:
+                    print("** next page: {} **".format(cursor))
+                return
 
-            o = storage.all(eval(args[0]))
-            print([o[k].__str__() for k in o])
+            self.print_list(storage.iter(args[0]))
 
         except NameError:
             print("** class doesn't exist **")
+        except ValueError:
+            print("** invalid page size or cursor **")
+
+    def print_list(self, objs):
+        """Print the list of the string representations of objs.
+
+        The output matches print([str(o) for o in objs]) but is written
+        one object at a time, so the list is never held in memory.
+
+        Args:
+            objs (iterable): The objects to print.
+        """
+        sys.stdout.write("[")
+        for i, obj in enumerate(objs):
+            sys.stdout.write(", " + repr(str(obj)) if i else repr(str(obj)))
+        sys.stdout.write("]\n")
 
     def do_update(self, line):
         """Updates an instance by adding or updating attribute.
@@ -179,20 +203,18 @@ class HBNBCommand(cmd.Cmd):
                 raise NameError()
             if len(my_list) < 2:
                 raise IndexError()
-            objects = storage.all()
-            key = my_list[0] + '.' + my_list[1]
-            if key not in objects:
+            v = storage.get(my_list[0], my_list[1])
+            if v is None:
                 raise KeyError()
             if len(my_list) < 3:
                 raise AttributeError()
             if len(my_list) < 4:
                 raise ValueError()
-            v = objects[key]
             try:
-                v.__dict__[my_list[2]] = eval(my_list[3])
+                setattr(v, my_list[2], eval(my_list[3]))
             except Exception:
-                v.__dict__[my_list[2]] = my_list[3]
-                v.save()
+                setattr(v, my_list[2], my_list[3])
+            v.save()
         except SyntaxError:
             print("** class name missing **")
         except NameError:
@@ -212,17 +234,11 @@ class HBNBCommand(cmd.Cmd):
         Args:
             line (str): The input command line.
         """
-        counter = 0
         try:
             my_list = split(line, " ")
             if my_list[0] not in self.__classes:
                 raise NameError()
-            objects = storage.all()
-            for key in objects:
-                name = key.split('.')
-                if name[0] == my_list[0]:
-                    counter += 1
-            print(counter)
+            print(storage.count(my_list[0]))
         except NameError:
             print("** class doesn't exist **")
 
@@ -266,7 +282,6 @@ class HBNBCommand(cmd.Cmd):
             elif my_list[1][:6] == "update":
                 args = self.strip_clean(my_list)
                 if isinstance(args, list):
-                    obj = storage.all()
                     key = args[0] + ' ' + args[1]
                     for k, v in args[2].items():
                         self.do_update(key + ' "{}" "{}"'.format(k, v))
@@ -277,4 +292,9 @@ class HBNBCommand(cmd.Cmd):
 
 
 if __name__ == '__main__':
-    HBNBCommand().cmdloop()
+    if sys.stdin.isatty():
+        HBNBCommand().cmdloop()
+    else:
+        # A script piped in is saved once, when it ends.
+        with storage.batch():
+            HBNBCommand().cmdloop()
@@ -4,6 +4,8 @@
 - If the environmental variable 'HBNB_TYPE_STORAGE' is set to 'db',
   it creates an instance of a database storage engine (DBStorage).
 - Otherwise, it creates an instance of a file storage engine (FileStorage).
+  If 'HBNB_FILE_CLASSES' lists class names, comma-separated, only those
+  classes are loaded (read from their own shards in sharded mode).
 """
 
 from os import getenv
@@ -11,7 +13,10 @@ from os import getenv
 if getenv("HBNB_TYPE_STORAGE") == "db":
     from models.engine.db_storage import DBStorage
     storage = DBStorage()
+    storage.reload()
 else:
     from models.engine.file_storage import FileStorage
     storage = FileStorage()
-storage.reload()
+    classes = getenv("HBNB_FILE_CLASSES")
+    storage.reload([name.strip() for name in classes.split(",")]
+                   if classes else None)
@@ -18,5 +18,5 @@ class Amenity(BaseModel, Base):
         place_amenities (sqlalchemy.relationship): Relationship with the Place model.
     """
     __tablename__ = "amenities"
-    name = Column(String(128), nullable=False)
+    name = Column(String(128), nullable=False, index=True)
     place_amenities = relationship("Place", secondary="place_amenity", viewonly=False)
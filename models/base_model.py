@@ -11,6 +11,21 @@ from sqlalchemy import String
 
 Base = declarative_base()
 
+
+def parse_datetime(value):
+    """Return value as a datetime, parsing it if it is a string.
+
+    Strings written by datetime.isoformat() go through the fast
+    datetime.fromisoformat(); anything else falls back to strptime().
+    """
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f")
+
+
 class BaseModel:
     """Represents the BaseModel class.
 
@@ -31,14 +46,23 @@ class BaseModel:
             *args (any): Unused.
             **kwargs (dict): Key/value pairs representing attributes.
         """
-        self.id = str(uuid4())
-        self.created_at = self.updated_at = datetime.utcnow()
-        if kwargs:
-            for key, value in kwargs.items():
-                if key == "created_at" or key == "updated_at":
-                    value = datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f")
-                if key != "__class__":
-                    setattr(self, key, value)
+        # A new instance is not in storage yet: skip the __setattr__ hook.
+        assign = super().__setattr__
+        assign("id", kwargs["id"] if "id" in kwargs else str(uuid4()))
+        assign("created_at", datetime.utcnow())
+        assign("updated_at", self.created_at)
+        for key, value in kwargs.items():
+            if key == "created_at" or key == "updated_at":
+                value = parse_datetime(value)
+            if key != "__class__":
+                assign(key, value)
+
+    def __setattr__(self, name, value):
+        """Set an attribute and let storage re-index the instance."""
+        super().__setattr__(name, value)
+        storage = getattr(models, "storage", None)
+        if storage is not None:
+            storage.touch(self, name)
 
     def save(self):
         """Update the 'updated_at' attribute with the current datetime."""
@@ -7,6 +7,7 @@ from sqlalchemy.orm import relationship
 from sqlalchemy import String
 from sqlalchemy import ForeignKey
 from sqlalchemy import Column
+from sqlalchemy import Index
 
 class City(BaseModel, Base):
     """Represents a city within a MySQL database.
@@ -17,8 +18,11 @@ class City(BaseModel, Base):
         __tablename__ (str): The name of the MySQL table storing City objects.
         name (sqlalchemy.String): The name of the City.
         state_id (sqlalchemy.String): The state ID associated with the City.
+        __table_args__ (tuple): The (state_id, name) index listing the
+            cities of a state in order.
     """
     __tablename__ = "cities"
+    __table_args__ = (Index("ix_cities_state_id_name", "state_id", "name"),)
     name = Column(String(128), nullable=False)
     state_id = Column(String(60), ForeignKey("states.id"), nullable=False)
     places = relationship("Place", backref="cities", cascade="delete")
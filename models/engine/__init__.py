@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+"""Helpers shared by the storage engines."""
+import json
+from fcntl import LOCK_EX
+from fcntl import LOCK_SH
+from fcntl import flock
+from base64 import urlsafe_b64decode
+from base64 import urlsafe_b64encode
+from binascii import Error
+from models.base_model import parse_datetime
+
+
+def encode_cursor(obj):
+    """Return the opaque page cursor pointing just after obj.
+
+    Pages are ordered on (created_at, id); the cursor holds both values.
+    """
+    text = json.dumps([obj.created_at.isoformat(), obj.id])
+    return urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Return the (created_at, id) pair held by a page cursor.
+
+    Raises:
+        ValueError: If cursor was not made by encode_cursor().
+    """
+    try:
+        created_at, id = json.loads(urlsafe_b64decode(cursor.encode()))
+        return parse_datetime(created_at), id
+    except (Error, TypeError, ValueError, UnicodeError):
+        raise ValueError("invalid page cursor: {}".format(cursor))
+
+
+def read_versions(path):
+    """Return the version of each class recorded in the file path.
+
+    Every process sharing a storage bumps the version of the classes it
+    changed after writing them, so a class whose version moved since it
+    was last read has to be read again.
+
+    Returns:
+        dict: <class name> = int, empty if path does not exist yet.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            flock(file, LOCK_SH)
+            text = file.read()
+    except FileNotFoundError:
+        return {}
+    return json.loads(text) if text else {}
+
+
+def bump_versions(path, names):
+    """Increment the version of the classes names in the file path.
+
+    The file is locked for the read-modify-write, so concurrent bumps from
+    several processes are never lost.
+
+    Returns:
+        dict: The versions of every class after the bump.
+    """
+    with open(path, "a+", encoding="utf-8") as file:
+        flock(file, LOCK_EX)
+        file.seek(0)
+        text = file.read()
+        versions = json.loads(text) if text else {}
+        for name in names:
+            versions[name] = versions.get(name, 0) + 1
+        file.seek(0)
+        file.truncate()
+        file.write(json.dumps(versions))
+    return versions
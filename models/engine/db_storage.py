@@ -1,7 +1,18 @@
 #!/usr/bin/python3
 """Defines the DBStorage engine."""
 
+import operator
 from os import getenv
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import monotonic
+from time import perf_counter
+from models.engine import bump_versions
+from models.engine import decode_cursor
+from models.engine import encode_cursor
+from models.engine import read_versions
+from models.engine.metrics import Metrics
+from models.engine.metrics import measured
 from models.base_model import Base
 from models.base_model import BaseModel
 from models.amenity import Amenity
@@ -11,69 +22,687 @@ from models.review import Review
 from models.state import State
 from models.user import User
 from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy import func
+from sqlalchemy import tuple_
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm import scoped_session
+from sqlalchemy.orm import selectinload
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+filter_operators = {"eq": operator.eq, "lt": operator.lt, "lte": operator.le,
+                    "gt": operator.gt, "gte": operator.ge,
+                    "in": lambda column, values: column.in_(values)}
+
+
+class TimedQueuePool(QueuePool):
+    """A QueuePool that records how long checkouts wait for a connection.
+
+    Attributes:
+        checkouts (int): The number of connections checked out.
+        wait_seconds (float): The total time spent waiting for them.
+        max_wait_seconds (float): The longest single wait.
+    """
+
+    checkouts = 0
+    wait_seconds = 0.0
+    max_wait_seconds = 0.0
+
+    def _do_get(self):
+        """Check a connection out of the pool, timing the wait."""
+        start = perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            wait = perf_counter() - start
+            self.checkouts += 1
+            self.wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
 
 class DBStorage:
     """Encapsulates the functionality of a database storage engine.
 
+    all() without a class walks every mapped class in turn over one
+    session, streaming each query in chunks of 'HBNB_MYSQL_CHUNK_SIZE'
+    rows (default 1000) rather than building a list per class first.
+
+    The connection pool is tuned with 'HBNB_MYSQL_POOL_SIZE' (default 5),
+    'HBNB_MYSQL_MAX_OVERFLOW' (10), 'HBNB_MYSQL_POOL_RECYCLE' in seconds
+    (-1, never), 'HBNB_MYSQL_POOL_TIMEOUT' in seconds (30) and
+    'HBNB_MYSQL_PRE_PING': '0' skips the liveness round-trip made on
+    each checkout, leaving stale connections to the recycle age.
+
+    'HBNB_MYSQL_REPLICAS' may list read replicas of 'HBNB_MYSQL_HOST',
+    comma-separated. Each reload() and close() then opens a read session
+    on the next replica in turn, and all(), iter(), get(), count(),
+    query() and page() use it until the session writes: from its first
+    new(), delete() or save() up to close(), every read goes to the
+    primary so that it sees its own changes.
+
+    When 'HBNB_MYSQL_CACHE_TTL' is set to a number of seconds, the results
+    of all(), count(), query() and page() are cached for that long, up to
+    'HBNB_MYSQL_CACHE_SIZE' results (default 256, least recently used
+    dropped first). new(), delete(), save() and attribute assignments
+    invalidate the results involving the classes they touch.
+
+    When 'HBNB_STORAGE_VERSIONS' names a file shared by every process
+    using the database, each commit bumps the version of the classes it
+    wrote in that file, and cached results are only served while the
+    versions of their classes are unchanged, so a write made by another
+    worker invalidates just the results involving the classes it changed.
+
+    Calls to all(), get(), count(), query(), page(), save(), bulk_save()
+    and reload() are measured through metrics, with the rows they return,
+    and so is each SQL statement run on the primary or a replica, as an
+    "sql" call with its statement; see models.engine.metrics.
+
+    Attributes:
+        metrics (Metrics): The sinks call measures are sent to.
+
     Instance Attributes:
         __engine (sqlalchemy.Engine): The operational SQLAlchemy engine.
         __session (sqlalchemy.Session): The active SQLAlchemy session.
+        __replicas (list): The engines of the read replicas.
+        __replica (sqlalchemy.Session): The read session on a replica,
+            None without replicas.
+        __wrote (bool): Whether the session wrote since it was opened.
+        __cache (OrderedDict): The cached results, least recently used
+            first, as <key> = (expiry time, generations, result).
+        __generations (dict): The count of invalidations of each class,
+            as <class name> = int.
+        __cache_stats (dict): The cache hits, misses and invalidations.
+        __versions (str): The path of the shared version file, if any.
+        __changed (set): The names of the classes written since the last
+            commit, to bump in the version file once it is made.
+        __chunk_size (int): The number of rows fetched per round-trip.
+        __batching (int): The depth of nested batch() blocks being run.
     """
 
     __engine = None
     __session = None
+    __classes = (State, City, User, Place, Review, Amenity)
+
     def __init__(self):
         """Instantiate a new DBStorage object."""
-        self.__engine = create_engine("mysql+mysqldb://{}:{}@{}/{}".
-                                      format(getenv("HBNB_MYSQL_USER"),
-                                             getenv("HBNB_MYSQL_PWD"),
-                                             getenv("HBNB_MYSQL_HOST"),
-                                             getenv("HBNB_MYSQL_DB")),
-                                      pool_pre_ping=True)
+        self.metrics = Metrics.from_env()
+        self.__engine = self.__connect(getenv("HBNB_MYSQL_HOST"))
         if getenv("HBNB_ENV") == "test":
             Base.metadata.drop_all(self.__engine)
+        self.__replicas = [self.__connect(host.strip()) for host in
+                           getenv("HBNB_MYSQL_REPLICAS", "").split(",")
+                           if host.strip()]
+        self.__replica = None
+        self.__wrote = False
+        self.__chunk_size = int(getenv("HBNB_MYSQL_CHUNK_SIZE", 1000))
+        self.__batching = 0
+        self.__cache = OrderedDict()
+        self.__cache_ttl = float(getenv("HBNB_MYSQL_CACHE_TTL", 0))
+        self.__cache_size = int(getenv("HBNB_MYSQL_CACHE_SIZE", 256))
+        self.__generations = {}
+        self.__cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+        self.__versions = getenv("HBNB_STORAGE_VERSIONS")
+        self.__changed = set()
+        for engine in [self.__engine] + self.__replicas:
+            self.__listen(engine)
+
+    @staticmethod
+    def __connect(host):
+        """Return an engine on the HBNB_MYSQL_DB database of host."""
+        return create_engine("mysql+mysqldb://{}:{}@{}/{}".
+                             format(getenv("HBNB_MYSQL_USER"),
+                                    getenv("HBNB_MYSQL_PWD"),
+                                    host,
+                                    getenv("HBNB_MYSQL_DB")),
+                             poolclass=TimedQueuePool,
+                             pool_size=int(getenv(
+                                 "HBNB_MYSQL_POOL_SIZE", 5)),
+                             max_overflow=int(getenv(
+                                 "HBNB_MYSQL_MAX_OVERFLOW", 10)),
+                             pool_recycle=int(getenv(
+                                 "HBNB_MYSQL_POOL_RECYCLE", -1)),
+                             pool_timeout=float(getenv(
+                                 "HBNB_MYSQL_POOL_TIMEOUT", 30)),
+                             pool_pre_ping=getenv(
+                                 "HBNB_MYSQL_PRE_PING") != "0")
+
+    def __listen(self, engine):
+        """Measure each SQL statement run on engine while metrics has sinks.
+
+        The start times are stacked on the connection, as statements do
+        not overlap on one connection.
+        """
+        @event.listens_for(engine, "before_cursor_execute")
+        def before(conn, cursor, statement, parameters, context, many):
+            if self.metrics.sinks:
+                conn.info.setdefault("hbnb_started", []).append(
+                    perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after(conn, cursor, statement, parameters, context, many):
+            started = conn.info.get("hbnb_started")
+            if started:
+                self.metrics.emit("sql", perf_counter() - started.pop(),
+                                  rows=max(cursor.rowcount, 0),
+                                  statement=statement)
 
-    def all(self, cls=None):
+        @event.listens_for(engine, "handle_error")
+        def error(context):
+            started = context.connection is not None and \
+                context.connection.info.get("hbnb_started")
+            if started:
+                started.pop()
+
+    def __reader(self):
+        """Return the session reads go to: a replica until a write."""
+        if self.__replica is None or self.__wrote:
+            return self.__session
+        return self.__replica
+
+    def pool_stats(self):
+        """Return a snapshot of the connection pool for monitoring.
+
+        Returns:
+            A dict with the pool size, the connections checked in and
+            out, the overflow beyond the pool size, and the number of
+            checkouts with their total and longest wait in seconds.
+        """
+        pool = self.__engine.pool
+        return {"size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+                "checkouts": pool.checkouts,
+                "wait_seconds": pool.wait_seconds,
+                "max_wait_seconds": pool.max_wait_seconds}
+
+    @measured("all", rows=len)
+    def all(self, cls=None, stats=None, load=None):
         """Query the current database session for objects of the given class.
 
         If cls is None, retrieves all types of objects.
 
+        Args:
+            cls (class or str): The class to query, or None for all of them.
+            stats (dict): If given, filled with {<class name>: {"rows": n,
+                "seconds": s}} for each class queried.
+            load (list): Relationship names, dotted for nested ones (e.g.
+                "cities.places"), to fetch up front with one extra query
+                each instead of one per object. With cls None, each name
+                applies to the classes that have it.
+
         Returns:
-            Dictionary with entries in the format <class name>.<object id> = object.
+            Dictionary with entries in the format
+            <class name>.<object id> = object.
         """
         if cls is None:
-            objs = self.__session.query(State).all()
-            objs.extend(self.__session.query(City).all())
-            objs.extend(self.__session.query(User).all())
-            objs.extend(self.__session.query(Place).all())
-            objs.extend(self.__session.query(Review).all())
-            objs.extend(self.__session.query(Amenity).all())
+            classes = self.__classes
+        elif type(cls) == str:
+            classes = (eval(cls),)
         else:
-            if type(cls) == str:
-                cls = eval(cls)
-            objs = self.__session.query(cls)
-        return {"{}.{}".format(type(o).__name__, o.id): o for o in objs}
+            classes = (cls,)
+        options = {c: [self.__eager(c, name) for name in load or ()
+                       if cls is not None or hasattr(c, name.split(".")[0])]
+                   for c in classes}
+        if stats is not None:
+            return dict(self.__rows(classes, stats, options))
+        involved = set(classes)
+        for c in classes:
+            for name in load or ():
+                target = c
+                for part in name.split("."):
+                    if not hasattr(target, part):
+                        break
+                    target = getattr(target, part).property.mapper.class_
+                    involved.add(target)
+        return self.__cached(("all", classes, tuple(load or ())), involved,
+                             lambda: dict(self.__rows(classes, None,
+                                                      options)), load)
+
+    def iter(self, cls=None, chunk_size=None):
+        """Yield the objects of class cls, or of all classes, as fetched.
+
+        Rows come from a server-side cursor chunk_size at a time, and the
+        session only keeps weak references to unmodified objects, so
+        memory stays flat however many rows are read.
+
+        Args:
+            cls (class or str): The class to iterate over, all if None.
+            chunk_size (int): The rows fetched per round-trip, defaulting
+                to 'HBNB_MYSQL_CHUNK_SIZE'.
+        """
+        if cls is None:
+            classes = self.__classes
+        elif type(cls) == str:
+            classes = (eval(cls),)
+        else:
+            classes = (cls,)
+        for _, obj in self.__rows(classes, chunk_size=chunk_size):
+            yield obj
+
+    def __eager(self, cls, name):
+        """Return the selectinload() option for a dotted relationship path.
+
+        Raises:
+            AttributeError: If a name on the path is not an attribute.
+        """
+        option = None
+        for part in name.split("."):
+            attr = getattr(cls, part)
+            option = selectinload(attr) if option is None \
+                else option.selectinload(attr)
+            cls = attr.property.mapper.class_
+        return option
+
+    def __rows(self, classes, stats=None, options=None, chunk_size=None):
+        """Yield (key, object) pairs for classes, chunk by chunk.
+
+        Args:
+            classes (iterable): The mapped classes to query, in order.
+            stats (dict): If given, receives per-class row counts and
+                timings as described in all().
+            options (dict): Loader options to apply, keyed by class.
+            chunk_size (int): The rows fetched per round-trip, if not
+                __chunk_size.
+
+        A class with loader options is fetched in one buffered query:
+        yield_per() streams rows through a server-side cursor, and the
+        selectin loads of each chunk cannot run on the connection while
+        it is open, as MySQLdb has one cursor per connection.
+        """
+        for cls in classes:
+            start = perf_counter()
+            rows = 0
+            query = self.__reader().query(cls)
+            if options and options.get(cls):
+                query = query.options(*options[cls]).all()
+            else:
+                query = query.yield_per(chunk_size or self.__chunk_size)
+            for obj in query:
+                rows += 1
+                yield "{}.{}".format(cls.__name__, obj.id), obj
+            if stats is not None:
+                stats[cls.__name__] = {"rows": rows,
+                                       "seconds": perf_counter() - start}
+
+    @measured("get", rows=lambda obj: int(obj is not None))
+    def get(self, cls, id):
+        """Return the cls object with the given id, or None if absent.
+
+        The session's identity map is checked before the database, so an
+        object already loaded costs no query.
+
+        Args:
+            cls (class or str): The class of the object.
+            id (str): The id of the object.
+        """
+        if type(cls) == str:
+            cls = eval(cls)
+        if cls not in self.__classes:
+            return None
+        return self.__reader().get(cls, id)
+
+    @measured("count")
+    def count(self, cls=None):
+        """Return the number of rows of class cls, or of all classes.
+
+        Each class costs one SELECT COUNT(*); no row is loaded.
+
+        Args:
+            cls (class or str): The class to count, all classes if None.
+        """
+        if cls is None:
+            return sum(self.count(c) for c in self.__classes)
+        if type(cls) == str:
+            cls = eval(cls)
+        if cls not in self.__classes:
+            return 0
+        return self.__cached(("count", cls), (cls,), lambda: self.__reader().
+                             query(func.count(cls.id)).scalar())
+
+    @measured("query", rows=len)
+    def query(self, cls, order_by=None, limit=None, offset=0, **filters):
+        """Return the cls objects matching filters, in the format of all().
+
+        The filters, order and slice compile to the WHERE, ORDER BY and
+        LIMIT/OFFSET clauses of a single SELECT.
+
+        Args:
+            cls (class or str): The class to query.
+            order_by (str or list): The attribute names to sort by, each
+                prefixed with '-' for descending order.
+            limit (int): The maximum number of objects returned.
+            offset (int): The number of matching objects skipped first.
+            **filters: <attribute>=value for equality, or
+                <attribute>__<op>=value with op one of lt, lte, gt, gte
+                or in.
+
+        Raises:
+            AttributeError: If an attribute is not a column of cls.
+            ValueError: If a filter names an unknown operator.
+        """
+        if type(cls) == str:
+            cls = eval(cls)
+        key = ("query", cls, repr(order_by), limit, offset,
+               repr(sorted(filters.items())))
+        return self.__cached(key, (cls,), lambda: self.__query(
+            cls, order_by, limit, offset, filters))
+
+    def __query(self, cls, order_by, limit, offset, filters):
+        """Run query() past the cache."""
+        query = self.__filter(cls, filters)
+        if isinstance(order_by, str):
+            order_by = [order_by]
+        for name in order_by or []:
+            column = getattr(cls, name.lstrip("-"))
+            query = query.order_by(column.desc() if name.startswith("-")
+                                   else column)
+        if offset:
+            query = query.offset(offset)
+        if limit is not None:
+            query = query.limit(limit)
+        return {"{}.{}".format(cls.__name__, o.id): o for o in query}
+
+    @measured("page", rows=lambda page: len(page[0]))
+    def page(self, cls, size, cursor=None, **filters):
+        """Return one page of the cls objects matching filters.
+
+        Pages follow the (created_at, id) order and each one is a single
+        SELECT seeking past the cursor, so its cost does not grow with
+        the number of pages before it.
+
+        Args:
+            cls (class or str): The class to list.
+            size (int): The maximum number of objects in the page.
+            cursor (str): The cursor returned with the previous page, or
+                None for the first page.
+            **filters: The conditions the objects must meet, as in query().
+
+        Returns:
+            A (page, cursor) tuple: the objects in the format of all() and
+            the cursor of the next page, or None after the last page.
+
+        Raises:
+            ValueError: If size is less than 1, or cursor or a filter is
+                invalid.
+        """
+        if size < 1:
+            raise ValueError("invalid page size: {}".format(size))
+        if type(cls) == str:
+            cls = eval(cls)
+        key = ("page", cls, size, cursor, repr(sorted(filters.items())))
+        return self.__cached(key, (cls,), lambda: self.__page(
+            cls, size, cursor, filters))
+
+    def __page(self, cls, size, cursor, filters):
+        """Run page() past the cache."""
+        query = self.__filter(cls, filters)
+        if cursor is not None:
+            created_at, id = decode_cursor(cursor)
+            query = query.filter(tuple_(cls.created_at, cls.id) >
+                                 tuple_(created_at, id))
+        objs = query.order_by(cls.created_at, cls.id).limit(size + 1).all()
+        page = {"{}.{}".format(cls.__name__, o.id): o for o in objs[:size]}
+        if len(objs) <= size:
+            return page, None
+        return page, encode_cursor(objs[size - 1])
+
+    def cache_stats(self):
+        """Return the result cache counters and size for monitoring.
+
+        Returns:
+            A dict with the cache hits, misses and invalidations, and the
+            number of results held.
+        """
+        return dict(self.__cache_stats, size=len(self.__cache))
+
+    def __cached(self, key, classes, compute, load=None):
+        """Return the cached result of key, or compute() and cache it.
+
+        Args:
+            key (tuple): The method and arguments the result is for.
+            classes (iterable): The classes whose changes invalidate it.
+            compute (callable): Returns the result when it is not cached.
+            load (list): The relationship paths eager loaded in the
+                result, re-attached with its objects on a hit.
+        """
+        if not self.__cache_ttl:
+            return compute()
+        shared = read_versions(self.__versions) if self.__versions else {}
+        generations = tuple((self.__generations.get(cls.__name__, 0),
+                             shared.get(cls.__name__, 0))
+                            for cls in classes)
+        entry = self.__cache.get(key)
+        if entry is not None and entry[0] > monotonic() and \
+                entry[1] == generations:
+            try:
+                result = self.__attach(entry[2], load)
+            except InvalidRequestError:
+                pass  # an object was changed behind the cache's back
+            else:
+                self.__cache.move_to_end(key)
+                self.__cache_stats["hits"] += 1
+                return result
+        self.__cache_stats["misses"] += 1
+        result = compute()
+        self.__cache[key] = (monotonic() + self.__cache_ttl, generations,
+                             self.__copy(result))
+        self.__cache.move_to_end(key)
+        while len(self.__cache) > self.__cache_size:
+            self.__cache.popitem(last=False)
+        return result
+
+    @classmethod
+    def __copy(cls, result):
+        """Return a shallow copy of a result, so the caller may change it."""
+        if isinstance(result, tuple):
+            return cls.__copy(result[0]), result[1]
+        if isinstance(result, dict):
+            return dict(result)
+        return result
+
+    def __attach(self, result, load=None):
+        """Return a cached result with its objects merged into the session.
+
+        The objects were loaded by an earlier, possibly closed, session;
+        merging them without a query lets their relationships load. The
+        relationships on the paths of load are not cascaded by merge(),
+        so the collections eager loaded with them are re-attached too.
+        """
+        if isinstance(result, tuple):
+            return self.__attach(result[0], load), result[1]
+        if not isinstance(result, dict):
+            return result
+        session = self.__reader()
+        attached = {}
+        for key, obj in result.items():
+            attached[key] = session.merge(obj, load=False)
+            for name in load or ():
+                self.__graft(session, obj, attached[key], name.split("."))
+        return attached
+
+    def __graft(self, session, obj, merged, path):
+        """Copy the relationships on path loaded on obj to merged.
+
+        The related objects are merged without a query and set as the
+        committed value, so they neither load again nor count as changes.
+        A relationship merged already holds in the session is kept.
+        """
+        if not path or path[0] not in obj.__dict__:
+            return
+        name, rest = path[0], path[1:]
+        value = obj.__dict__[name]
+        related = value if isinstance(value, list) else \
+            [] if value is None else [value]
+        targets = [session.merge(o, load=False) for o in related]
+        for o, target in zip(related, targets):
+            self.__graft(session, o, target, rest)
+        if name not in merged.__dict__:
+            set_committed_value(merged, name, targets
+                                if isinstance(value, list) else
+                                (targets or [None])[0])
+
+    def __invalidate(self, *names):
+        """Drop the cached results involving the classes named names.
+
+        With a version file, the classes are also kept to be bumped in it
+        by the next commit.
+        """
+        if self.__versions:
+            self.__changed.update(names)
+        if self.__cache_ttl:
+            for name in names:
+                self.__generations[name] = self.__generations.get(name, 0) + 1
+                self.__cache_stats["invalidations"] += 1
+
+    def __filter(self, cls, filters):
+        """Return a query of cls restricted by filters, as in query().
+
+        Raises:
+            AttributeError: If an attribute is not a column of cls.
+            ValueError: If a filter names an unknown operator.
+        """
+        query = self.__reader().query(cls)
+        for name, value in filters.items():
+            attr, _, op = name.rpartition("__")
+            if not attr:
+                attr, op = name, "eq"
+            if op not in filter_operators:
+                raise ValueError("unknown filter operator: {}".format(op))
+            query = query.filter(filter_operators[op](getattr(cls, attr),
+                                                      value))
+        return query
 
     def new(self, obj):
-        """Include obj in the current database session."""
-        self.__session.add(obj)
+        """Include obj in the current database session.
+
+        An object read from a replica has its state merged into the
+        session instead.
+        """
+        self.__wrote = True
+        self.__invalidate(type(obj).__name__)
+        if self.__replica is not None and obj in self.__replica:
+            self.__session.merge(obj)
+        else:
+            self.__session.add(obj)
+
+    def bulk_new(self, objs):
+        """Include every object of objs in the current database session."""
+        for obj in objs:
+            self.new(obj)
+
+    @measured("bulk_save")
+    def bulk_save(self, objs):
+        """Insert every object of objs and commit them once.
+
+        The objects are flushed 'HBNB_MYSQL_CHUNK_SIZE' at a time; each
+        flush sends the rows of a table as batched multi-row INSERTs
+        instead of a statement and a commit per object.
+        """
+        objs = list(objs)
+        for start in range(0, len(objs), self.__chunk_size):
+            self.bulk_new(objs[start:start + self.__chunk_size])
+            self.__session.flush()
+        self.save()
+
+    def touch(self, obj, name):
+        """Invalidate the cached results of the class of obj.
+
+        The session tracks the change itself. Private attributes, such as
+        the state SQLAlchemy sets on each instance it builds, are skipped.
+        """
+        if not name.startswith("_"):
+            self.__invalidate(type(obj).__name__)
+
+    @measured("save")
     def save(self):
-        """Commit all modifications to the current database session."""
+        """Commit all modifications to the current database session.
+
+        Inside a batch() block, the commit is left to the end of the block.
+        """
+        self.__wrote = True
+        session = self.__session
+        changed = list(session.new) + list(session.dirty) + \
+            list(session.deleted)
+        self.__invalidate(*{type(obj).__name__ for obj in changed})
+        self.metrics.add(rows=len(changed))
+        if not self.__batching:
+            self.__commit()
+
+    @contextmanager
+    def batch(self):
+        """Run a block of changes as a single transaction.
+
+        Every save() called in the block, e.g. by BaseModel.save(), is
+        folded into one commit when the block exits. If the block raises,
+        the transaction is rolled back instead. Nested blocks are part of
+        the outermost one.
+        """
+        self.__batching += 1
+        try:
+            yield self
+        except BaseException:
+            self.__batching -= 1
+            if not self.__batching:
+                self.__session.rollback()
+                self.__cache.clear()
+                self.__changed.clear()
+            raise
+        self.__batching -= 1
+        if not self.__batching:
+            self.__commit()
+
+    def __commit(self):
+        """Commit the session and bump the versions of the classes written.
+
+        The versions are bumped after the commit, so a process seeing them
+        move reads the new rows.
+        """
         self.__session.commit()
+        if self.__changed:
+            bump_versions(self.__versions, self.__changed)
+            self.__changed.clear()
+
     def delete(self, obj=None):
         """Remove obj from the current database session."""
         if obj is not None:
+            self.__wrote = True
+            self.__invalidate(type(obj).__name__)
+            if self.__replica is not None and obj in self.__replica:
+                obj = self.__session.merge(obj)
             self.__session.delete(obj)
+
+    @measured("reload")
     def reload(self):
-        """Establish all tables in the database and set up a new session."""
+        """Establish all tables in the database and set up a new session.
+
+        With replicas, a read session is opened on the next one in turn.
+        """
         Base.metadata.create_all(self.__engine)
         session_factory = sessionmaker(bind=self.__engine,
                                        expire_on_commit=False)
         Session = scoped_session(session_factory)
         self.__session = Session()
+        self.__rotate()
+
     def close(self):
-        """Terminate the operational SQLAlchemy session."""
+        """Terminate the operational SQLAlchemy sessions.
+
+        The next reads go to the next replica, if there are any.
+        """
         self.__session.close()
+        self.__changed.clear()
+        if self.__replica is not None:
+            self.__replica.close()
+        self.__rotate()
+
+    def __rotate(self):
+        """Open a read session on the next replica and forget past writes."""
+        if self.__replicas:
+            self.__replicas.append(self.__replicas.pop(0))
+            self.__replica = sessionmaker(bind=self.__replicas[-1],
+                                          expire_on_commit=False)()
+        self.__wrote = False
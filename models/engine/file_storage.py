@@ -1,7 +1,23 @@
 #!/usr/bin/python3
 """Defines the FileStorage class."""
 
+import os
 import json
+import time
+import heapq
+import operator
+from os import getenv
+from fcntl import LOCK_EX
+from fcntl import flock
+from contextlib import contextmanager
+from json.decoder import WHITESPACE
+from tempfile import mkstemp
+from models.engine import bump_versions
+from models.engine import decode_cursor
+from models.engine import encode_cursor
+from models.engine import read_versions
+from models.engine.metrics import Metrics
+from models.engine.metrics import measured
 from models.base_model import BaseModel
 from models.place import Place
 from models.amenity import Amenity
@@ -10,61 +26,1162 @@ from models.city import City
 from models.state import State
 from models.review import Review
 
+classes_all = {"BaseModel": BaseModel, "User": User, "State": State,
+               "City": City, "Amenity": Amenity, "Place": Place,
+               "Review": Review}
+filter_operators = {"eq": operator.eq, "lt": operator.lt, "lte": operator.le,
+                    "gt": operator.gt, "gte": operator.ge,
+                    "in": lambda value, values: value in values}
+
+
 class FileStorage:
     """Represents a storage engine with abstracted functionality.
 
+    When the environment variable 'HBNB_FILE_JOURNAL' is set to '1',
+    save() appends one record per changed object to a journal next to
+    __file_path instead of rewriting the whole file, and folds the journal
+    into a fresh snapshot once it grows past 'HBNB_FILE_JOURNAL_MAX' bytes.
+
+    When 'HBNB_FILE_SHARDED' is set to '1', each class is kept in its own
+    file next to __file_path (file.State.json, file.City.json, ...), so a
+    save only rewrites the classes that changed and a reload can be
+    limited to the classes a process needs, e.g. through the
+    'HBNB_FILE_CLASSES' list read by models/__init__.py. Saving a class
+    that was left out reads its records back from disk first.
+
+    When 'HBNB_FILE_LAZY' is set to '1', reload() keeps each record as its
+    JSON text and only builds the model instance the first time it is
+    reached through all(), related() or delete().
+
+    When 'HBNB_STORAGE_VERSIONS' names a file shared by every process
+    using the same __file_path, each save() bumps the version of the
+    classes it wrote in that file, and reload() and close() only read
+    back the classes whose version moved since they were last loaded,
+    instead of the whole file whenever any of it changed.
+
+    Calls to all(), get(), count(), query(), page(), save(), bulk_save()
+    and reload() are measured through metrics, with the rows and bytes
+    they read or write; see models.engine.metrics.
+
+    Attributes:
+        metrics (Metrics): The sinks call measures are sent to.
+
     Instance Attributes:
         __file_path (str): The file name used to store objects.
         __objects (dict): A dictionary containing instantiated objects.
+        __pending (dict): Keys changed since the last save, mapped to
+            their object, or to None when the object was deleted.
+        __by_class (dict): The objects of __objects grouped by class name,
+            as <class name> = {<class name>.<object id> = object}.
+        __indexed (dict): The __objects dictionary __by_class was built for.
+        __foreign_keys (dict): The attributes indexed for each class name.
+        __by_attr (dict): Reverse indexes on __foreign_keys, as
+            (<class name>, <attribute>) = {value = {key = object}}.
+        __attr_values (dict): The value each key is indexed under, as
+            (<class name>, <attribute>) = {key = value}.
+        __records (dict): Records loaded lazily and not built yet, as
+            <class name> = {<class name>.<object id> = JSON text}.
+        __fragments (dict): The JSON text of each object as last written,
+            as <key> = (object, text); dropped whenever the object changes.
+            For an object loaded eagerly, the text is left on disk and
+            the entry is (object, (<path>, stamp), byte offset, length).
+        __loaded (tuple): The __objects dictionary, the on-disk stamps, as
+            {path = stamp}, of the files it was last loaded from or saved
+            to, and the set of class names it holds in full (None for all).
+        __replayed (tuple): The __objects dictionary, the inode of the
+            journal its records were applied from (None if there was no
+            journal) and the byte offset they were applied up to.
+        __batching (int): The depth of nested batch() blocks being run.
+        __deferred (bool): Whether save() was called inside the batch.
+        __seen (dict): The version of each class in the version file when
+            it was last loaded or saved, as <class name> = int.
     """
 
     __file_path = "file.json"
     __objects = {}
+    __pending = {}
+    __by_class = {}
+    __indexed = None
+    __foreign_keys = {"City": ("state_id",), "Place": ("city_id",),
+                      "Review": ("place_id",)}
+    __by_attr = {}
+    __attr_values = {}
+    __records = {}
+    __fragments = {}
+    __loaded = None
+    __replayed = None
+    __batching = 0
+    __deferred = False
+    __seen = {}
+
+    def __init__(self):
+        """Instantiate a new FileStorage object."""
+        self.__journaled = getenv("HBNB_FILE_JOURNAL") == "1"
+        self.__journal_max = int(getenv("HBNB_FILE_JOURNAL_MAX", 1048576))
+        self.__sharded = getenv("HBNB_FILE_SHARDED") == "1"
+        self.__lazy = getenv("HBNB_FILE_LAZY") == "1"
+        self.__versions = getenv("HBNB_STORAGE_VERSIONS")
+        self.metrics = Metrics.from_env()
+        self.__subset = None
+        self.__progress = [None, 0, 0, 0]
 
-    def all(self, cls=None):
+    @measured("all", rows=len)
+    def all(self, cls=None, load=None):
         """Retrieve a dictionary of instantiated objects stored in __objects.
 
         If a specific cls is provided, returns objects of that type.
         Otherwise, returns the entire __objects dictionary.
+
+        load is accepted for parity with DBStorage and ignored: the
+        relationship properties already read from in-memory indexes.
         """
         if cls is not None:
-            if type(cls) == str:
-                cls = eval(cls)
-            cls_dict = {}
-            for key, value in self.__objects.items():
-                if type(value) == cls:
-                    cls_dict[key] = value
-            return cls_dict
+            if type(cls) != str:
+                cls = cls.__name__
+            if cls in self.__records:
+                self.__materialize(cls)
+            return self.__index().get(cls, {})
+        for cls in list(self.__records):
+            self.__materialize(cls)
         return self.__objects
 
+    def iter(self, cls=None, chunk_size=1000):
+        """Yield the stored objects of class cls, or of all classes.
+
+        Unlike all(), no dictionary is built for the caller, and records
+        loaded lazily are built chunk_size at a time as they are reached.
+        Objects come in the same order as from all(): without cls, that is
+        the order they were stored in, then the lazy records class by
+        class. Objects added or deleted while iterating may or may not be
+        seen.
+
+        Args:
+            cls (class or str): The class to iterate over, all if None.
+            chunk_size (int): The number of lazy records built at once.
+        """
+        if cls is not None and type(cls) != str:
+            cls = cls.__name__
+        if cls is None:
+            for key in list(self.__objects):
+                obj = self.__objects.get(key)
+                if obj is not None:
+                    yield obj
+        for name in [cls] if cls is not None else list(self.__records):
+            keys = [] if cls is None else list(self.__index().get(name, {}))
+            keys.extend(self.__records.get(name, {}))
+            for start in range(0, len(keys), chunk_size):
+                chunk = keys[start:start + chunk_size]
+                self.__materialize(name, chunk)
+                for key in chunk:
+                    obj = self.__objects.get(key)
+                    if obj is not None:
+                        yield obj
+
+    @measured("get", rows=lambda obj: int(obj is not None))
+    def get(self, cls, id):
+        """Return the cls object with the given id, or None if absent.
+
+        Args:
+            cls (class or str): The class of the object.
+            id (str): The id of the object.
+        """
+        if type(cls) != str:
+            cls = cls.__name__
+        key = "{}.{}".format(cls, id)
+        self.__materialize(cls, [key])
+        return self.__objects.get(key)
+
+    @measured("count")
+    def count(self, cls=None):
+        """Return the number of stored objects of class cls, or of all.
+
+        Counted from the per-class index and the lazily loaded records,
+        so no object is built.
+
+        Args:
+            cls (class or str): The class to count, all classes if None.
+        """
+        if cls is None:
+            return len(self.__objects) + sum(map(len, self.__records.values()))
+        if type(cls) != str:
+            cls = cls.__name__
+        return len(self.__index().get(cls, {})) + \
+            len(self.__records.get(cls, {}))
+
+    @measured("query", rows=len)
+    def query(self, cls, order_by=None, limit=None, offset=0, **filters):
+        """Return the cls objects matching filters, in the format of all().
+
+        Each filter is <attribute>=value for equality or
+        <attribute>__<op>=value with op one of lt, lte, gt, gte or in.
+        Equality and in filters on an indexed foreign key start from its
+        reverse index; the other filters are checked on the candidates.
+
+        Args:
+            cls (class or str): The class to query.
+            order_by (str or list): The attribute names to sort by, each
+                prefixed with '-' for descending order.
+            limit (int): The maximum number of objects returned.
+            offset (int): The number of matching objects skipped first.
+            **filters: The conditions the objects must all meet.
+
+        Raises:
+            ValueError: If a filter names an unknown operator.
+        """
+        items = self.__select(cls, filters)
+        if isinstance(order_by, str):
+            order_by = [order_by]
+        order_by = order_by or []
+        stop = None if limit is None else offset + limit
+        if stop is not None and len(order_by) == 1:
+            pick = heapq.nlargest if order_by[0].startswith("-") \
+                else heapq.nsmallest
+            items = pick(stop, items, key=self.__sort_key(order_by[0]))
+        else:
+            for name in reversed(order_by):
+                items.sort(key=self.__sort_key(name),
+                           reverse=name.startswith("-"))
+        return dict(items[offset:stop])
+
+    @measured("page", rows=lambda page: len(page[0]))
+    def page(self, cls, size, cursor=None, **filters):
+        """Return one page of the cls objects matching filters.
+
+        Pages follow the (created_at, id) order, so a page stays stable
+        while objects are added or deleted before it.
+
+        Args:
+            cls (class or str): The class to list.
+            size (int): The maximum number of objects in the page.
+            cursor (str): The cursor returned with the previous page, or
+                None for the first page.
+            **filters: The conditions the objects must meet, as in query().
+
+        Returns:
+            A (page, cursor) tuple: the objects in the format of all() and
+            the cursor of the next page, or None after the last page.
+
+        Raises:
+            ValueError: If size is less than 1, or cursor or a filter is
+                invalid.
+        """
+        if size < 1:
+            raise ValueError("invalid page size: {}".format(size))
+        items = self.__select(cls, filters)
+        if cursor is not None:
+            after = decode_cursor(cursor)
+            items = [item for item in items
+                     if self.__position(item) > after]
+        items = heapq.nsmallest(size + 1, items, key=self.__position)
+        if len(items) <= size:
+            return dict(items), None
+        return dict(items[:size]), encode_cursor(items[size - 1][1])
+
     def new(self, obj):
         """Add obj to __objects with the key <obj_class_name>.id."""
-        self.__objects["{}.{}".format(type(obj).__name__, obj.id)] = obj
+        key = "{}.{}".format(type(obj).__name__, obj.id)
+        self.__discard(key)
+        self.__put(key, obj)
+        self.__pending[key] = obj
+        self.__fragments.pop(key, None)
 
-    def save(self):
-        """Serialize __objects and write to the JSON file __file_path."""
-        object_dict = {key: obj.to_dict() for key, obj in self.__objects.items()}
-        with open(self.__file_path, "w", encoding="utf-8") as file:
-            json.dump(object_dict, file)
+    def bulk_new(self, objs):
+        """Add every object of objs to __objects, as new() does."""
+        for obj in objs:
+            self.new(obj)
+
+    @measured("bulk_save")
+    def bulk_save(self, objs):
+        """Add every object of objs to __objects and persist them.
+
+        All the objects are written by a single save(), where saving them
+        one by one would rewrite the file (or shards) once per object.
+        """
+        self.bulk_new(objs)
+        self.save()
+
+    @contextmanager
+    def batch(self):
+        """Run a block of changes with a single save at its end.
 
-    def reload(self):
-        """Deserialize the JSON file __file_path to populate __objects, if it exists."""
+        Every save() called in the block, e.g. by BaseModel.save(), is
+        deferred until the block exits. Changes still pending are saved
+        on entry, so that if the block raises, nothing more is saved and
+        __objects is reloaded from the files as they were then; all the
+        objects are rebuilt. Nested blocks are part of the outermost one.
+        """
+        outermost = not self.__batching
+        if outermost:
+            if self.__pending:
+                self.save()
+            FileStorage.__deferred = False
+        FileStorage.__batching += 1
         try:
-            with open(self.__file_path, "r", encoding="utf-8") as file:
-                for obj_data in json.load(file).values():
-                    class_name = obj_data["__class__"]
-                    del obj_data["__class__"]
-                    self.new(eval(class_name)(**obj_data))
-        except FileNotFoundError:
-            pass
+            yield self
+        except BaseException:
+            FileStorage.__batching -= 1
+            if outermost:
+                self.__rollback()
+            raise
+        FileStorage.__batching -= 1
+        if outermost and self.__deferred:
+            self.save()
+
+    def related(self, cls, attr, value):
+        """Return the list of cls objects whose attribute attr equals value.
+
+        Foreign keys listed in __foreign_keys are answered from their
+        reverse index; any other attribute falls back to a scan of cls.
+        """
+        if type(cls) != str:
+            cls = cls.__name__
+        self.__index()
+        if attr in self.__foreign_keys.get(cls, ()):
+            bucket = self.__by_attr[(cls, attr)].get(value, {})
+            lazy = [key for key, obj in bucket.items() if obj is None]
+            if lazy:
+                self.__materialize(cls, lazy)
+                bucket = self.__by_attr[(cls, attr)].get(value, {})
+            return list(bucket.values())
+        return [obj for obj in self.all(cls).values()
+                if getattr(obj, attr, None) == value]
+
+    def touch(self, obj, name):
+        """Mark a stored obj dirty after its attribute name was assigned.
+
+        The object is queued for the next save, its cached JSON text is
+        dropped and, if name is an indexed foreign key, it is re-indexed.
+        """
+        cls = type(obj).__name__
+        key = cls + "." + str(obj.__dict__.get("id"))
+        if self.__objects.get(key) is not obj:
+            return
+        self.__pending[key] = obj
+        self.__fragments.pop(key, None)
+        if name in self.__foreign_keys.get(cls, ()):
+            self.__index()
+            self.__unlink(key, cls)
+            self.__link(key, cls, vars(obj), obj)
+
+    @measured("save")
+    def save(self):
+        """Persist __objects to the JSON file __file_path.
+
+        In journaled mode only the pending changes are appended to the
+        journal, unless it has outgrown its limit and must be compacted.
+        The journal stays locked meanwhile, and the records other
+        processes appended since this one last read it are applied
+        first, so a compaction never drops them.
+        In sharded mode only the shards of classes with pending changes
+        are rewritten. Inside a batch() block, the save is deferred to the
+        end of the block.
+        """
+        if self.__batching:
+            FileStorage.__deferred = True
+            return
+        dirty = {key.split(".")[0] for key in self.__pending}
+        self.metrics.add(rows=len(self.__pending))
+        if self.__journaled:
+            path = self.__journal_path()
+            files = {}
+            with self.__lock_journal() as file:
+                start = file.seek(0, os.SEEK_END)
+                if start:
+                    file.seek(start - 1)
+                    if file.read(1) != b"\n":
+                        file.write(b"\n")  # end a record torn by a crash
+                        start += 1
+                self.__catch_up(file, start)
+                try:
+                    for key, obj in self.__pending.items():
+                        if obj is None:
+                            line = '{{"key": {}}}\n'.format(json.dumps(key))
+                        else:
+                            line = '{{"key": {}, "obj": {}}}\n'.format(
+                                json.dumps(key),
+                                self.__fragment(key, obj, files))
+                        file.write(line.encode("utf-8"))
+                finally:
+                    self.__close(files)
+                size = file.tell()
+                FileStorage.__replayed = (self.__objects,
+                                          os.fstat(file.fileno()).st_ino,
+                                          size)
+                self.metrics.add(bytes=size - start)
+                self.__pending.clear()
+                file.flush()
+                self.__remember(set(), {path: self.__stat(path)})
+                if size > self.__journal_max:
+                    self.__compact()
+        elif self.__sharded and not os.path.exists(self.__file_path) and \
+                not os.path.exists(self.__journal_path()):
+            self.__compact(dirty | {cls for cls in self.__index() if not
+                                    os.path.exists(self.__shard_path(cls))})
+        elif os.path.exists(self.__journal_path()):
+            with self.__lock_journal() as file:
+                self.__catch_up(file, file.seek(0, os.SEEK_END))
+                self.__compact()
+        else:
+            self.__compact()
+        if self.__versions and dirty:
+            versions = bump_versions(self.__versions, dirty)
+            for cls in dirty:
+                if versions[cls] == self.__seen.get(cls, 0) + 1:
+                    self.__seen[cls] = versions[cls]
+
+    @measured("reload")
+    def reload(self, classes=None, progress=None):
+        """Deserialize the JSON file __file_path to populate __objects.
+
+        The file is parsed one object at a time, so only a single record
+        is held as text at any point. Any journal left next to the file
+        is replayed on top of it. Nothing is read when none of the files
+        changed on disk since __objects was last loaded from or saved to.
+        With a version file, only the classes whose version moved since
+        then are read again.
+
+        Args:
+            classes (list): The names of the classes to load, all if None.
+                Only the matching shards are read in sharded mode.
+            progress (callable): Called as progress(objects, bytes, seconds)
+                every 10000 records read and once when loading completes.
+        """
+        self.__subset = classes
+        self.__progress = [progress, 0, 0, time.monotonic()]
+        names = set(classes) if classes is not None else None
+        versions = read_versions(self.__versions) if self.__versions \
+            else None
+        if versions is not None and self.__holds(names):
+            self.__refresh({cls for cls in (names or classes_all)
+                            if versions.get(cls, 0) !=
+                            self.__seen.get(cls, 0)}, versions)
+            self.metrics.add(rows=self.__progress[1],
+                             bytes=self.__progress[2])
+            self.__tick(0, True)
+            return
+        stamps = {path: self.__stat(path) for path in self.__paths(names)}
+        if self.__holds(names) and \
+                all(path in self.__loaded[1] and
+                    self.__loaded[1][path] == stamp
+                    for path, stamp in stamps.items()):
+            return
+        shards = [self.__shard_path(cls) for cls in (names or classes_all)]
+        if self.__sharded and any(stamps.get(path) for path in shards):
+            for path in shards:
+                self.__load(path)
+        else:
+            self.__load(self.__file_path, names)
+        self.__replay(names)
+        self.__remember(names, stamps)
+        if versions is not None:
+            self.__seen.update((cls, versions.get(cls, 0))
+                               for cls in (names or classes_all))
+        self.metrics.add(rows=self.__progress[1], bytes=self.__progress[2])
+        self.__tick(0, True)
 
     def delete(self, obj=None):
         """Remove a specified object from __objects, if present."""
         try:
-            del self.__objects["{}.{}".format(type(obj).__name__, obj.id)]
+            key = "{}.{}".format(type(obj).__name__, obj.id)
+            self.__materialize(type(obj).__name__, [key])
+            self.__drop(key)
+            self.__pending[key] = None
         except (AttributeError, KeyError):
             pass
 
     def close(self):
-        """Invoke the reload method."""
-        self.reload()
+        """Invoke the reload method for the classes loaded last."""
+        self.reload(self.__subset)
+
+    def __select(self, cls, filters):
+        """Return the (key, object) items of class cls matching filters.
+
+        Equality and in filters on an indexed foreign key start from its
+        reverse index; the other filters are checked on the candidates.
+        """
+        if type(cls) != str:
+            cls = cls.__name__
+        conditions = [self.__condition(name, value)
+                      for name, value in filters.items()]
+        candidates = None
+        self.__index()
+        for attr, test, value in conditions:
+            if attr in self.__foreign_keys.get(cls, ()) and \
+                    test in (filter_operators["eq"], filter_operators["in"]):
+                index = self.__by_attr[(cls, attr)]
+                keys = {}
+                for v in ([value] if test is filter_operators["eq"]
+                          else value):
+                    keys.update(index.get(v, {}))
+                candidates = keys if candidates is None else \
+                    {key: None for key in candidates if key in keys}
+        if candidates is None:
+            objs = self.all(cls)
+        else:
+            self.__materialize(cls, list(candidates))
+            objs = {key: self.__objects[key] for key in candidates}
+        return [(key, obj) for key, obj in objs.items()
+                if self.__matches(obj, conditions)]
+
+    @staticmethod
+    def __position(item):
+        """Return the (created_at, id) page position of a (key, obj) item."""
+        return item[1].created_at, item[1].id
+
+    @staticmethod
+    def __condition(name, value):
+        """Split the filter name=value into (attribute, test, value)."""
+        attr, _, op = name.rpartition("__")
+        if not attr:
+            return name, filter_operators["eq"], value
+        if op not in filter_operators:
+            raise ValueError("unknown filter operator: {}".format(op))
+        return attr, filter_operators[op], value
+
+    @staticmethod
+    def __matches(obj, conditions):
+        """Tell whether obj meets all the (attribute, test, value) conditions.
+
+        As in SQL, a comparison with a missing value is not a match.
+        """
+        for attr, test, value in conditions:
+            try:
+                if not test(getattr(obj, attr, None), value):
+                    return False
+            except TypeError:
+                return False
+        return True
+
+    @staticmethod
+    def __sort_key(name):
+        """Return the sort key for order_by name, missing values first."""
+        attr = name.lstrip("-")
+
+        def key(item):
+            value = getattr(item[1], attr, None)
+            return value is not None, value
+        return key
+
+    def __rollback(self):
+        """Drop every change not saved and reload the files from scratch.
+
+        Every class held in full before the rollback is read again, not
+        only those of the last reload(), which may have been merged in
+        since; the classes never loaded stay on disk.
+        """
+        held = None if self.__loaded is None else self.__loaded[2]
+        subset = self.__subset
+        FileStorage.__objects = {}
+        FileStorage.__records = {}
+        FileStorage.__pending = {}
+        FileStorage.__fragments = {}
+        FileStorage.__loaded = None
+        FileStorage.__replayed = None
+        FileStorage.__deferred = False
+        FileStorage.__seen = {}
+        self.reload(None if held is None else sorted(held))
+        self.__subset = subset
+
+    def __refresh(self, names, versions):
+        """Read the objects of the classes names back from the files.
+
+        The objects of those classes are dropped first, so deletions made
+        by other processes are seen too; those with unsaved changes are
+        kept unless the files hold a newer version of them.
+
+        Args:
+            names (set): The classes that changed in the version file.
+            versions (dict): The versions read from the version file.
+        """
+        if not names:
+            return
+        for cls in names:
+            for key in list(self.__index().get(cls, {})):
+                if key not in self.__pending:
+                    self.__drop(key)
+            for key in list(self.__records.get(cls, {})):
+                if key not in self.__pending:
+                    self.__discard(key)
+        shards = [self.__shard_path(cls) for cls in names]
+        if self.__sharded and any(os.path.exists(path) for path in shards):
+            for path in shards:
+                self.__load(path)
+        else:
+            self.__load(self.__file_path, names)
+        self.__replay(names)
+        self.__seen.update((cls, versions.get(cls, 0)) for cls in names)
+
+    def __journal_path(self):
+        """Return the path of the journal kept next to __file_path."""
+        return self.__file_path + ".journal"
+
+    def __shard_path(self, cls):
+        """Return the path of the shard holding the objects of class cls."""
+        root, ext = os.path.splitext(self.__file_path)
+        return "{}.{}{}".format(root, cls, ext)
+
+    def __paths(self, names=None):
+        """Return the files backing the classes in names, all if None."""
+        paths = [self.__file_path, self.__journal_path()]
+        if self.__sharded:
+            paths.extend(self.__shard_path(cls)
+                         for cls in (names or classes_all))
+        return paths
+
+    def __stat(self, path):
+        """Return the inode, size and mtime of path, or None if missing.
+
+        path may also be the descriptor of an open file.
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def __holds(self, names):
+        """Tell whether __objects was fully loaded for the classes names."""
+        if self.__loaded is None or self.__loaded[0] is not self.__objects:
+            return False
+        held = self.__loaded[2]
+        return held is None or (names is not None and names <= held)
+
+    def __remember(self, names, stamps):
+        """Record the stamps of files whose contents now match __objects.
+
+        Args:
+            names (set): The classes the files hold in full, all if None.
+            stamps (dict): The files just read or written, as
+                <path> = stamp taken before reading or after writing.
+        """
+        if self.__loaded is None or self.__loaded[0] is not self.__objects:
+            FileStorage.__loaded = (self.__objects, {}, set())
+        held = self.__loaded[2]
+        if held is not None:
+            held = None if names is None else held | names
+            if held is not None and held >= set(classes_all):
+                held = None
+        self.__loaded[1].update(stamps)
+        FileStorage.__loaded = (self.__objects, self.__loaded[1], held)
+
+    def __index(self):
+        """Return __by_class, rebuilding it if it no longer matches __objects.
+
+        The index is kept current by __put() and __drop(); a rebuild only
+        happens when __objects was replaced or edited behind their back.
+        """
+        if self.__indexed is not self.__objects or \
+                len(self.__objects) != sum(map(len, self.__by_class.values())):
+            by_class = {}
+            for key, obj in self.__objects.items():
+                by_class.setdefault(type(obj).__name__, {})[key] = obj
+            FileStorage.__by_class = by_class
+            FileStorage.__indexed = self.__objects
+            FileStorage.__by_attr = {}
+            FileStorage.__attr_values = {}
+            for cls, attrs in self.__foreign_keys.items():
+                for attr in attrs:
+                    self.__by_attr[(cls, attr)] = {}
+                    self.__attr_values[(cls, attr)] = {}
+            for key, obj in self.__objects.items():
+                self.__link(key, type(obj).__name__, vars(obj), obj)
+            for cls, texts in self.__records.items():
+                if cls in self.__foreign_keys:
+                    for key, text in texts.items():
+                        self.__link(key, cls, json.loads(text), None)
+        return self.__by_class
+
+    def __put(self, key, obj):
+        """Store obj under key in __objects and in the per-class index."""
+        by_class = self.__index()
+        old = self.__objects.get(key)
+        if old is not None:
+            by_class[type(old).__name__].pop(key, None)
+            self.__unlink(key, type(old).__name__)
+        self.__objects[key] = obj
+        by_class.setdefault(type(obj).__name__, {})[key] = obj
+        self.__link(key, type(obj).__name__, vars(obj), obj)
+
+    def __drop(self, key):
+        """Remove key from __objects and from the per-class index."""
+        by_class = self.__index()
+        obj = self.__objects.pop(key)
+        by_class[type(obj).__name__].pop(key, None)
+        self.__unlink(key, type(obj).__name__)
+        self.__fragments.pop(key, None)
+
+    def __stash(self, key, obj_data, text):
+        """Keep the record of key as JSON text until it is first needed.
+
+        Args:
+            key (str): The <class name>.<object id> key of the record.
+            obj_data (dict): The decoded record, used for its foreign keys.
+            text (str): The JSON text of the record.
+        """
+        if key in self.__objects:
+            self.__drop(key)
+        else:
+            self.__discard(key)
+        cls = key.partition(".")[0]
+        self.__records.setdefault(cls, {})[key] = text
+        self.__index()
+        self.__link(key, cls, obj_data, None)
+
+    def __discard(self, key):
+        """Forget the lazily loaded record of key, if there is one."""
+        cls = key.partition(".")[0]
+        texts = self.__records.get(cls)
+        if texts is None or key not in texts:
+            return
+        del texts[key]
+        if not texts:
+            del self.__records[cls]
+        self.__index()
+        self.__unlink(key, cls)
+
+    def __materialize(self, cls, keys=None):
+        """Build the lazily loaded records of class cls into __objects.
+
+        Args:
+            cls (str): The class name of the records.
+            keys (list): The keys of the records to build, all if None.
+        """
+        texts = self.__records.get(cls, {})
+        for key in list(texts if keys is None else keys):
+            text = texts.get(key)
+            if text is None:
+                continue
+            self.__discard(key)
+            obj = self.__build(json.loads(text))
+            self.__put(key, obj)
+            self.__fragments[key] = (obj, text)
+
+    def __link(self, key, cls, values, obj):
+        """Add key to the reverse indexes on the foreign keys of cls.
+
+        Args:
+            key (str): The <class name>.<object id> key to index.
+            cls (str): The class name of the object.
+            values (dict): The attribute values of the object.
+            obj (BaseModel): The object, or None for a lazy record.
+        """
+        for attr in self.__foreign_keys.get(cls, ()):
+            value = values.get(attr)
+            self.__attr_values[(cls, attr)][key] = value
+            self.__by_attr[(cls, attr)].setdefault(value, {})[key] = obj
+
+    def __unlink(self, key, cls):
+        """Remove key from the reverse indexes on the foreign keys of cls."""
+        for attr in self.__foreign_keys.get(cls, ()):
+            value = self.__attr_values[(cls, attr)].pop(key, None)
+            bucket = self.__by_attr[(cls, attr)].get(value, {})
+            bucket.pop(key, None)
+            if not bucket:
+                self.__by_attr[(cls, attr)].pop(value, None)
+
+    def __build(self, obj_data):
+        """Return a new model instance from its dictionary representation."""
+        class_name = obj_data.pop("__class__")
+        return classes_all[class_name](**obj_data)
+
+    def __load(self, path, names=None):
+        """Put every object stored in the JSON file path into __objects.
+
+        Each object built is clean: its fragment is the place of its JSON
+        text in path, not the text itself, so the next save copies the
+        objects that did not change back from path without keeping their
+        text in memory meanwhile.
+
+        Args:
+            path (str): The snapshot or shard to read, if it exists.
+            names (set): The class names to keep, all if None.
+        """
+        try:
+            with open(path, "r", encoding="utf-8", newline="") as file:
+                source = (path, self.__stat(file.fileno()))
+                for key, obj_data, size, text, offset in self.__stream(file):
+                    if names is None or obj_data["__class__"] in names:
+                        if self.__lazy:
+                            self.__stash(key, obj_data, text)
+                        else:
+                            obj = self.__build(obj_data)
+                            self.__put(key, obj)
+                            self.__fragments[key] = (
+                                obj, source, offset, self.__size(text))
+                    self.__tick(size)
+        except FileNotFoundError:
+            pass
+
+    def __stream(self, file, chunk_size=65536):
+        """Yield the members of the JSON object in file one at a time.
+
+        Unlike json.load(), only the text of the member being decoded is
+        kept in memory, read chunk_size characters at a time.
+
+        Yields:
+            tuple: The key, the decoded value, the number of bytes read
+                for that member since the end of the previous one, the
+                JSON text of the value and the byte offset of that text.
+        """
+        decoder = json.JSONDecoder()
+        mark, at = 0, 0  # buf[mark] is at byte offset at in file
+        last = 0
+        buf = file.read(chunk_size)
+        pos = self.__skip(buf, 0)
+        while pos == len(buf) and buf:
+            at += self.__size(buf)
+            buf = file.read(chunk_size)
+            pos = self.__skip(buf, 0)
+        if buf[pos:pos + 1] != "{":
+            raise ValueError("Expecting '{' at the start of the JSON file")
+        pos += 1
+        separator = ""
+        while True:
+            pos = self.__skip(buf, pos)
+            if pos == len(buf):
+                at += self.__size(buf[mark:])
+                mark = 0
+                buf = file.read(chunk_size)
+                pos = 0
+                if not buf:
+                    raise ValueError("Unexpected end of JSON file")
+                continue
+            if buf[pos] == "}":
+                return
+            start = pos
+            if buf[pos] != (separator or buf[pos]):
+                raise ValueError("Expecting '{}' before {!r}".format(
+                    separator, buf[pos:pos + 40]))
+            while True:
+                try:
+                    pos = self.__skip(buf, start + len(separator))
+                    key, end = decoder.raw_decode(buf, pos)
+                    pos = self.__skip(buf, buf.index(":", end) + 1)
+                    value, end = decoder.raw_decode(buf, pos)
+                    break
+                except ValueError:
+                    more = file.read(chunk_size)
+                    if not more:
+                        raise
+                    at += self.__size(buf[mark:start])
+                    mark = 0
+                    buf = buf[start:] + more
+                    start = 0
+            text = buf[pos:end]
+            offset = at + self.__size(buf[mark:pos])
+            mark, at = end, offset + self.__size(text)
+            yield key, value, at - last, text, offset
+            last = at
+            pos = end
+            separator = ","
+
+    @staticmethod
+    def __skip(buf, pos):
+        """Return the position of the first non-whitespace at or after pos."""
+        return WHITESPACE.match(buf, pos).end()
+
+    @staticmethod
+    def __size(text):
+        """Return the number of bytes text takes in UTF-8."""
+        return len(text) if text.isascii() else len(text.encode("utf-8"))
+
+    def __tick(self, size, done=False):
+        """Count one record of size bytes toward the reload progress."""
+        progress = self.__progress
+        if done:
+            if progress[0] is not None:
+                progress[0](progress[1], progress[2],
+                            time.monotonic() - progress[3])
+            return
+        progress[1] += 1
+        progress[2] += size
+        if progress[0] is not None and progress[1] % 10000 == 0:
+            progress[0](progress[1], progress[2],
+                        time.monotonic() - progress[3])
+
+    def __fragment(self, key, obj, files):
+        """Return the JSON text of obj, serializing it only if it changed.
+
+        The text of an object loaded eagerly is copied from the file it was
+        loaded from, unless that file was replaced since.
+
+        Args:
+            key (str): The <class name>.<object id> key of obj.
+            obj (BaseModel): The object to write.
+            files (dict): The source files opened so far, as <path> = file,
+                or None if it was replaced; closed by the caller.
+        """
+        cached = self.__fragments.get(key)
+        if cached is not None and cached[0] is obj and len(cached) == 4:
+            _, (path, stamp), offset, size = cached
+            if path not in files:
+                try:
+                    files[path] = open(path, "rb")
+                except FileNotFoundError:
+                    files[path] = None
+                else:
+                    if self.__stat(files[path].fileno()) != stamp:
+                        files[path].close()
+                        files[path] = None
+            if files[path] is not None:
+                files[path].seek(offset)
+                return files[path].read(size).decode("utf-8")
+            cached = None
+        if cached is None or cached[0] is not obj:
+            cached = (obj, json.dumps(obj.to_dict()))
+            self.__fragments[key] = cached
+        return cached[1]
+
+    @staticmethod
+    def __close(files):
+        """Close the source files opened by __fragment()."""
+        for file in files.values():
+            if file is not None:
+                file.close()
+
+    def __texts(self, files, cls=None):
+        """Yield the key and JSON text of every object of cls, all if None.
+
+        Lazily loaded records are written back from their original text.
+        """
+        objects = self.__objects if cls is None else \
+            self.__index().get(cls, {})
+        for key, obj in objects.items():
+            yield key, self.__fragment(key, obj, files)
+        for texts in (self.__records.values() if cls is None else
+                      [self.__records.get(cls, {})]):
+            yield from texts.items()
+
+    def __write(self, path, texts, names):
+        """Write objects to the JSON file path in place of its contents.
+
+        Objects that did not change since they were last written reuse
+        their cached JSON text. The file is written to a temporary file
+        first and moved over path, so a crash never leaves a truncated
+        file behind; each process writes a temporary file of its own, so
+        concurrent saves do not move each other's away. The fragment of
+        each object written then points to its text in the new file.
+
+        Args:
+            path (str): The snapshot or shard to write.
+            texts (iterable): The (key, JSON text) pairs to write.
+            names (set): The classes objects holds in full, all if None.
+        """
+        fd, tmp_path = mkstemp(dir=os.path.dirname(path) or ".",
+                               prefix=os.path.basename(path) + ".")
+        spans = []
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as file:
+                file.write("{")
+                offset = 1
+                for key, text in texts:
+                    prefix = (", " if spans else "") + json.dumps(key) + ": "
+                    file.write(prefix + text)
+                    offset += self.__size(prefix)
+                    spans.append((key, offset, self.__size(text)))
+                    offset += spans[-1][2]
+                file.write("}")
+                file.flush()
+                os.chmod(tmp_path, self.__mode(path))
+                stamp = self.__stat(file.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        source = (path, stamp)
+        for key, offset, size in spans:
+            cached = self.__fragments.get(key)
+            if cached is not None:
+                self.__fragments[key] = (cached[0], source, offset, size)
+        self.metrics.add(bytes=stamp[1])
+        self.__remember(names, {path: stamp})
+
+    @staticmethod
+    def __mode(path):
+        """Return the permissions a new version of the file path gets.
+
+        Those of path if it exists, else those open() would give it.
+        """
+        try:
+            return os.stat(path).st_mode & 0o777
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            return 0o666 & ~umask
+
+    def __unlink_file(self, path):
+        """Remove the file path, if it exists."""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        self.__remember(set(), {path: None})
+
+    def __compact(self, names=None):
+        """Write a snapshot of __objects and drop the journal.
+
+        The classes written that were left out of a subset reload are read
+        back from disk first, so the snapshot never drops them.
+
+        Args:
+            names (set): In sharded mode, the classes whose shards are
+                rewritten; all of them, folding the journal in, if None.
+        """
+        self.__merge(set(classes_all) if names is None or
+                     not self.__sharded else names)
+        files = {}
+        try:
+            if not self.__sharded:
+                self.__write(self.__file_path, self.__texts(files), None)
+            else:
+                for cls in (names if names is not None else
+                            set(classes_all) | set(self.__index())):
+                    self.__write(self.__shard_path(cls),
+                                 self.__texts(files, cls), {cls})
+        finally:
+            self.__close(files)
+        if self.__sharded and names is None:
+            self.__unlink_file(self.__file_path)
+        if names is None:
+            self.__unlink_file(self.__journal_path())
+        self.__pending.clear()
+
+    def __merge(self, names):
+        """Read the records of the classes names not loaded in full.
+
+        They are kept as JSON text, as in lazy mode, so they are written
+        back as they are on disk. Objects created or changed since the
+        last save keep precedence over the records on disk.
+
+        Args:
+            names (set): The classes about to be written.
+        """
+        if self.__loaded is None or self.__loaded[0] is not self.__objects \
+                or self.__loaded[2] is None:
+            return
+        names = names - self.__loaded[2]
+        if not names:
+            return
+
+        def keep(key):
+            return key not in self.__objects and key not in self.__pending
+
+        shards = [self.__shard_path(cls) for cls in names]
+        if not (self.__sharded and any(os.path.exists(path)
+                                       for path in shards)):
+            shards = [self.__file_path]
+        for path in shards:
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    for key, obj_data, _, text, _ in self.__stream(file):
+                        if obj_data["__class__"] in names and keep(key):
+                            self.__stash(key, obj_data, text)
+            except FileNotFoundError:
+                pass
+        try:
+            with open(self.__journal_path(), "rb") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    key = record["key"]
+                    if key.split(".")[0] not in names or not keep(key):
+                        continue
+                    if "obj" in record:
+                        self.__stash(key, record["obj"],
+                                     json.dumps(record["obj"]))
+                    else:
+                        self.__discard(key)
+        except FileNotFoundError:
+            pass
+        self.__remember(names, {})
+
+    @contextmanager
+    def __lock_journal(self):
+        """Open the journal for appending under an exclusive lock.
+
+        A process that compacted the journal while this one waited for the
+        lock removed it, so the lock is taken again on the new journal.
+        """
+        path = self.__journal_path()
+        while True:
+            file = open(path, "a+b")
+            flock(file, LOCK_EX)
+            stamp = self.__stat(path)
+            if stamp is not None and \
+                    stamp[0] == os.fstat(file.fileno()).st_ino:
+                break
+            file.close()
+        with file:
+            yield file
+
+    def __catch_up(self, file, end):
+        """Apply the records of the locked journal file not applied yet.
+
+        These are the records other processes appended, up to end, since
+        this process last replayed or wrote the journal. Records for the
+        keys with pending changes are skipped: those changes are newer.
+        """
+        replayed = self.__replayed
+        if replayed is None or replayed[0] is not self.__objects:
+            return
+        start = replayed[2] if replayed[1] == os.fstat(file.fileno()).st_ino \
+            else 0
+        if start < end:
+            held = None if self.__loaded is None or \
+                self.__loaded[0] is not self.__objects else self.__loaded[2]
+            self.__apply(file, start, held, self.__pending)
+
+    def __replay(self, names=None):
+        """Apply the journal records, in order, on top of __objects.
+
+        A record that cannot be decoded, such as one cut short by an
+        interrupted save, is skipped. Replay stops before a last record
+        still being appended by another process. The journal itself is
+        never modified here; save() ends a torn record under an exclusive
+        lock before appending.
+
+        Args:
+            names (set): The class names to replay records for, all if None.
+        """
+        try:
+            with open(self.__journal_path(), "rb") as file:
+                self.__apply(file, 0, names)
+        except FileNotFoundError:
+            FileStorage.__replayed = (self.__objects, None, 0)
+
+    def __apply(self, file, start, names=None, skip=()):
+        """Apply the complete journal records of file from byte start on.
+
+        Args:
+            file (file): The journal, opened in binary mode.
+            start (int): The offset of the first record to apply.
+            names (set): The class names to apply records for, all if None.
+            skip (dict): The keys whose records are left out.
+        """
+        file.seek(start)
+        offset = start
+        for line in file:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            self.__tick(len(line))
+            key = record["key"]
+            if names is not None and key.split(".")[0] not in names or \
+                    key in skip:
+                continue
+            if "obj" in record and self.__lazy:
+                self.__stash(key, record["obj"], json.dumps(record["obj"]))
+            elif "obj" in record:
+                self.__put(key, self.__build(record["obj"]))
+            elif key in self.__objects:
+                self.__drop(key)
+            else:
+                self.__discard(key)
+        FileStorage.__replayed = (self.__objects,
+                                  os.fstat(file.fileno()).st_ino, offset)
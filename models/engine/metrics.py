@@ -0,0 +1,219 @@
+#!/usr/bin/python3
+"""Timing of storage calls and the sinks their measures are sent to.
+
+Each engine holds a Metrics object as its 'metrics' attribute. Its calls
+(all(), get(), save(), reload(), ...) and, for DBStorage, every SQL
+statement are timed while at least one sink is attached, and each sink
+is called with a measure dict:
+
+    {"call": "all", "seconds": 0.0021, "slow": False, "rows": 120, ...}
+
+along with "bytes" for the files FileStorage reads and writes and
+"statement" for SQL statements. Sinks are plain callables, so any
+function can be attached; LogSink and HistogramSink cover the common
+cases.
+
+'HBNB_STORAGE_METRICS' attaches sinks at start-up, comma-separated among
+'log' and 'histogram', and 'HBNB_STORAGE_SLOW_MS' sets the duration in
+milliseconds from which a call is flagged slow; setting it alone attaches
+a LogSink, so slow calls get logged.
+"""
+import logging
+from bisect import bisect_left
+from functools import wraps
+from os import getenv
+from threading import Lock
+from threading import local
+from time import perf_counter
+
+
+class Metrics:
+    """Times storage calls and sends their measures to the sinks.
+
+    The calls open to add() are tracked per thread, so concurrent requests
+    of a threaded server never add to each other's measures.
+
+    Attributes:
+        sinks (list): The callables each measure is sent to.
+        slow (float): The seconds from which a call is flagged slow, None
+            to flag none.
+    """
+
+    def __init__(self, sinks=(), slow=None):
+        """Instantiate a Metrics object sending measures to sinks."""
+        self.sinks = list(sinks)
+        self.slow = slow
+        self.__local = local()
+
+    @classmethod
+    def from_env(cls):
+        """Return a Metrics object set up from the environment.
+
+        Raises:
+            ValueError: If 'HBNB_STORAGE_METRICS' names an unknown sink.
+        """
+        slow = getenv("HBNB_STORAGE_SLOW_MS")
+        slow = float(slow) / 1000 if slow else None
+        names = [name.strip() for name in
+                 getenv("HBNB_STORAGE_METRICS", "").split(",")
+                 if name.strip()]
+        if not names and slow is not None:
+            names = ["log"]
+        sinks = {"log": LogSink, "histogram": HistogramSink}
+        for name in names:
+            if name not in sinks:
+                raise ValueError("unknown metrics sink: {}".format(name))
+        return cls([sinks[name]() for name in names], slow)
+
+    def add(self, **fields):
+        """Add fields, such as rows or bytes, to the innermost open call."""
+        calls = getattr(self.__local, "calls", None)
+        if calls:
+            measure = calls[-1]
+            for name, value in fields.items():
+                measure[name] = measure.get(name, 0) + value
+
+    def emit(self, call, seconds, **fields):
+        """Send the measure of a call that took seconds to every sink."""
+        measure = dict(fields, call=call, seconds=seconds,
+                       slow=self.slow is not None and seconds >= self.slow)
+        for sink in self.sinks:
+            sink(measure)
+
+    def timed(self, method, *args, **kwargs):
+        """Call method(*args, **kwargs) as a call open to add().
+
+        Returns:
+            tuple: The result, the seconds the call took and the measure
+                fields added to it through add().
+        """
+        calls = getattr(self.__local, "calls", None)
+        if calls is None:
+            calls = self.__local.calls = []
+        fields = {}
+        calls.append(fields)
+        start = perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        finally:
+            seconds = perf_counter() - start
+            calls.pop()
+        return result, seconds, fields
+
+
+def measured(call, rows=None):
+    """Decorate a storage method so its calls are measured as call.
+
+    Nothing is timed while the engine's metrics have no sink.
+
+    Args:
+        call (str): The name the calls are measured under.
+        rows (callable): Returns the number of rows of a result.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            metrics = self.metrics
+            if not metrics.sinks:
+                return method(self, *args, **kwargs)
+            result, seconds, fields = metrics.timed(method, self, *args,
+                                                    **kwargs)
+            if rows is not None:
+                fields["rows"] = rows(result)
+            metrics.emit(call, seconds, **fields)
+            return result
+        return wrapper
+    return decorator
+
+
+class LogSink:
+    """Logs each measure, slow calls as warnings and others as debug.
+
+    Attributes:
+        logger (logging.Logger): The logger written to.
+    """
+
+    def __init__(self, logger=None):
+        """Instantiate a LogSink writing to logger, 'hbnb.storage' if None."""
+        self.logger = logger or logging.getLogger("hbnb.storage")
+
+    def __call__(self, measure):
+        """Log measure."""
+        level = logging.WARNING if measure["slow"] else logging.DEBUG
+        if not self.logger.isEnabledFor(level):
+            return
+        details = "".join(" {}={}".format(name, measure[name])
+                          for name in ("rows", "bytes") if name in measure)
+        self.logger.log(level, "%s%s %.3f ms%s%s",
+                        "slow " if measure["slow"] else "", measure["call"],
+                        measure["seconds"] * 1000, details,
+                        "\n" + measure["statement"]
+                        if "statement" in measure else "")
+
+
+class HistogramSink:
+    """Aggregates the measures of each call into latency histograms.
+
+    Attributes:
+        buckets (tuple): The upper bounds, in seconds, of the buckets.
+    """
+
+    buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    def __init__(self):
+        """Instantiate an empty HistogramSink."""
+        self.__calls = {}
+        self.__lock = Lock()
+
+    def __call__(self, measure):
+        """Count measure in the histogram of its call."""
+        with self.__lock:
+            stats = self.__calls.get(measure["call"])
+            if stats is None:
+                stats = {"count": 0, "seconds": 0.0, "max_seconds": 0.0,
+                         "rows": 0, "bytes": 0, "slow": 0,
+                         "buckets": [0] * (len(self.buckets) + 1)}
+                self.__calls[measure["call"]] = stats
+            seconds = measure["seconds"]
+            stats["count"] += 1
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+            stats["rows"] += measure.get("rows", 0)
+            stats["bytes"] += measure.get("bytes", 0)
+            stats["slow"] += measure["slow"]
+            stats["buckets"][bisect_left(self.buckets, seconds)] += 1
+
+    def snapshot(self):
+        """Return the statistics of each call.
+
+        Returns:
+            A dict of <call> = {"count", "seconds", "max_seconds", "rows",
+            "bytes", "slow", "buckets"}, where buckets holds the number of
+            calls within each bound of buckets, then beyond the last one.
+        """
+        with self.__lock:
+            return {call: dict(stats, buckets=list(stats["buckets"]))
+                    for call, stats in self.__calls.items()}
+
+    def prometheus(self, prefix="hbnb_storage"):
+        """Return the statistics in the Prometheus text exposition format."""
+        calls = sorted(self.snapshot().items())
+        lines = ["# TYPE {}_call_seconds histogram".format(prefix)]
+        for call, stats in calls:
+            total = 0
+            bounds = [str(b) for b in self.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, stats["buckets"]):
+                total += count
+                lines.append('{}_call_seconds_bucket{{call="{}",le="{}"}} {}'.
+                             format(prefix, call, bound, total))
+            lines.append('{}_call_seconds_sum{{call="{}"}} {}'.format(
+                prefix, call, stats["seconds"]))
+            lines.append('{}_call_seconds_count{{call="{}"}} {}'.format(
+                prefix, call, stats["count"]))
+        for name in ("rows", "bytes", "slow"):
+            metric = "{}_{}_total".format(
+                prefix, "slow_calls" if name == "slow" else name)
+            lines.append("# TYPE {} counter".format(metric))
+            lines.extend('{}{{call="{}"}} {}'.format(metric, call, stats[name])
+                         for call, stats in calls)
+        return "\n".join(lines) + "\n"
@@ -14,6 +14,7 @@ from sqlalchemy import Float
 from sqlalchemy import ForeignKey
 from sqlalchemy import Integer
 from sqlalchemy import Column
+from sqlalchemy import Index
 
 association_table = Table("place_amenity", Base.metadata,
                           Column("place_id", String(60),
@@ -43,10 +44,17 @@ class Place(BaseModel, Base):
         reviews (sqlalchemy.relationship): Relationship with the Review model.
         amenities (sqlalchemy.relationship): Relationship with the Amenity model.
         amenity_ids (list): A list of IDs for linked amenities.
+        __table_args__ (tuple): The (city_id, price_by_night) index for
+            searches within a city and the (created_at, id) index the
+            pages of places are sought on.
     """
     __tablename__ = "places"
+    __table_args__ = (Index("ix_places_city_id_price_by_night",
+                            "city_id", "price_by_night"),
+                      Index("ix_places_created_at_id", "created_at", "id"))
     city_id = Column(String(60), ForeignKey("cities.id"), nullable=False)
-    user_id = Column(String(60), ForeignKey("users.id"), nullable=False)
+    user_id = Column(String(60), ForeignKey("users.id"), nullable=False,
+                     index=True)
     name = Column(String(128), nullable=False)
     description = Column(String(1024))
     number_rooms = Column(Integer, default=0)
@@ -63,18 +71,15 @@ class Place(BaseModel, Base):
         @property
         def reviews(self):
             """Retrieve a list of all linked Reviews."""
-            review_list = []
-            for review in list(models.storage.all(Review).values()):
-                if review.place_id == self.id:
-                    review_list.append(review)
-            return review_list
+            return models.storage.related(Review, "place_id", self.id)
 
         @property
         def amenities(self):
             """Get/set linked all Amenities."""
             amenity_list = []
-            for amenity in list(models.storage.all(Amenity).values()):
-                if amenity.id in self.amenity_ids:
+            for amenity_id in dict.fromkeys(self.amenity_ids):
+                amenity = models.storage.get(Amenity, amenity_id)
+                if amenity is not None:
                     amenity_list.append(amenity)
             return amenity_list
 
@@ -20,15 +20,11 @@ class State(BaseModel, Base):
         cities (sqlalchemy.relationship): Relationship with the City model.
     """
     __tablename__ = "states"
-    name = Column(String(128), nullable=False)
+    name = Column(String(128), nullable=False, index=True)
     cities = relationship("City", backref="state", cascade="delete")
 
     if getenv("HBNB_TYPE_STORAGE") != "db":
         @property
         def cities(self):
             """Retrieve a list of all related City objects."""
-            city_list = []
-            for city in list(models.storage.all(City).values()):
-                if city.state_id == self.id:
-                    city_list.append(city)
-            return city_list
+            return models.storage.related(City, "state_id", self.id)
@@ -21,7 +21,7 @@ class User(BaseModel, Base):
         reviews (sqlalchemy.relationship): Relationship with the Review model.
     """
     __tablename__ = "users"
-    email = Column(String(128), nullable=False)
+    email = Column(String(128), nullable=False, index=True)
     password = Column(String(128), nullable=False)
     first_name = Column(String(128))
     last_name = Column(String(128))
@@ -0,0 +1,14 @@
+-- Adds the indexes declared on the models to a database whose tables
+-- were created before them; DBStorage.reload() creates new tables with
+-- their indexes already. Run against the database to upgrade, e.g.
+--   cat setup_mysql_indexes.sql | mysql -uroot -p hbnb_dev_db
+
+CREATE INDEX ix_states_name ON states (name);
+CREATE INDEX ix_cities_state_id_name ON cities (state_id, name);
+CREATE INDEX ix_users_email ON users (email);
+CREATE INDEX ix_places_user_id ON places (user_id);
+CREATE INDEX ix_places_city_id_price_by_night ON places (city_id, price_by_night);
+CREATE INDEX ix_places_created_at_id ON places (created_at, id);
+CREATE INDEX ix_reviews_place_id ON reviews (place_id);
+CREATE INDEX ix_reviews_user_id ON reviews (user_id);
+CREATE INDEX ix_amenities_name ON amenities (name);
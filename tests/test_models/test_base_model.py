@@ -92,6 +92,13 @@ class TestBaseModel(unittest.TestCase):
         self.assertEqual(another_base.id, "5")
         self.assertEqual(another_base.created_at, dt)
 
+    def test_init_kwargs_timestamps(self):
+        """Test initialization with timestamps in other formats."""
+        dt = datetime(2017, 9, 28, 21, 3, 54)
+        base = BaseModel(created_at=dt.isoformat(), updated_at=dt)
+        self.assertEqual(base.created_at, dt)
+        self.assertEqual(base.updated_at, dt)
+
     def test_str_representation(self):
         """Test __str__ representation."""
         str_representation = self.base.__str__()
@@ -1,24 +1,39 @@
 #!/usr/bin/python3
-"""Defines unit tests for models/engine/db_storage.py."""
+"""Defines unit tests for models/engine/db_storage.py.
 
+The tests run on MySQL when HBNB_TYPE_STORAGE is 'db'. Otherwise they run
+on an SQLite database file standing in for it: the models are then mapped
+for FileStorage, so the tests of relationships are skipped.
+"""
+
+import os
 import pep8
 import models
-import MySQLdb
+import tempfile
 import unittest
 from os import getenv
+from unittest.mock import patch
 from models.base_model import Base
+from models.base_model import BaseModel
 from models.review import Review
 from models.place import Place
 from models.city import City
 from models.amenity import Amenity
 from models.state import State
 from models.user import User
+from models.engine import bump_versions
+from models.engine import read_versions
 from models.engine.db_storage import DBStorage
-from models.engine.file_storage import FileStorage
+from models.engine.metrics import HistogramSink
+from models.engine.metrics import Metrics
+from sqlalchemy import create_engine
+from sqlalchemy import inspect
+from sqlalchemy import text
 from sqlalchemy.engine.base import Engine
 from sqlalchemy.orm.session import Session
 from sqlalchemy.orm import sessionmaker
 
+
 class TestDBStorage(unittest.TestCase):
     """Unit tests for testing the DBStorage class."""
 
@@ -26,51 +41,76 @@ class TestDBStorage(unittest.TestCase):
     def setUpClass(cls):
         """Set up the DBStorage testing environment.
 
-        Instantiate a new DBStorage.
+        Instantiate a new DBStorage, on an SQLite file out of db mode.
         Populate the DBStorage test session with instances of all classes.
         """
-        if type(models.storage) == DBStorage:
-            cls.storage = DBStorage()
-            Base.metadata.create_all(cls.storage._DBStorage__engine)
-            Session = sessionmaker(bind=cls.storage._DBStorage__engine)
-            cls.storage._DBStorage__session = Session()
-            cls.state = State(name="California")
-            cls.storage._DBStorage__session.add(cls.state)
-            cls.city = City(name="San_Jose", state_id=cls.state.id)
-            cls.storage._DBStorage__session.add(cls.city)
-            cls.user = User(email="poppy@holberton.com", password="betty")
-            cls.storage._DBStorage__session.add(cls.user)
-            cls.place = Place(city_id=cls.city.id, user_id=cls.user.id,
-                              name="School")
-            cls.storage._DBStorage__session.add(cls.place)
-            cls.amenity = Amenity(name="Wifi")
-            cls.storage._DBStorage__session.add(cls.amenity)
-            cls.review = Review(place_id=cls.place.id, user_id=cls.user.id,
-                                text="stellar")
-            cls.storage._DBStorage__session.add(cls.review)
-            cls.storage._DBStorage__session.commit()
+        cls.sqlite = None
+        if type(models.storage) != DBStorage:
+            fd, cls.sqlite = tempfile.mkstemp(suffix=".db")
+            os.close(fd)
+        cls.storage = cls.connect()
+        Base.metadata.create_all(cls.storage._DBStorage__engine)
+        Session = sessionmaker(bind=cls.storage._DBStorage__engine)
+        cls.storage._DBStorage__session = Session()
+        cls.state = State(name="California")
+        cls.storage._DBStorage__session.add(cls.state)
+        cls.city = City(name="San_Jose", state_id=cls.state.id)
+        cls.storage._DBStorage__session.add(cls.city)
+        cls.user = User(email="poppy@holberton.com", password="betty")
+        cls.storage._DBStorage__session.add(cls.user)
+        cls.place = Place(city_id=cls.city.id, user_id=cls.user.id,
+                          name="School")
+        cls.storage._DBStorage__session.add(cls.place)
+        cls.amenity = Amenity(name="Wifi")
+        cls.storage._DBStorage__session.add(cls.amenity)
+        cls.review = Review(place_id=cls.place.id, user_id=cls.user.id,
+                            text="stellar")
+        cls.storage._DBStorage__session.add(cls.review)
+        cls.storage._DBStorage__session.commit()
 
     @classmethod
     def tearDownClass(cls):
         """Tear down the DBStorage testing environment.
 
         Delete all instantiated test classes.
-        Clear the DBStorage session.
+        Clear the DBStorage session and remove the SQLite file, if any.
+        """
+        cls.storage._DBStorage__session.delete(cls.state)
+        cls.storage._DBStorage__session.delete(cls.city)
+        cls.storage._DBStorage__session.delete(cls.user)
+        cls.storage._DBStorage__session.delete(cls.amenity)
+        cls.storage._DBStorage__session.commit()
+        del cls.state
+        del cls.city
+        del cls.user
+        del cls.place
+        del cls.amenity
+        del cls.review
+        cls.storage._DBStorage__session.close()
+        cls.storage._DBStorage__engine.dispose()
+        del cls.storage
+        if cls.sqlite is not None:
+            os.remove(cls.sqlite)
+
+    @classmethod
+    def connect(cls, **env):
+        """Return a new DBStorage, with env added to the environment.
+
+        Out of db mode, the MySQL URL is swapped for the SQLite file, with
+        the same pool arguments.
         """
-        if type(models.storage) == DBStorage:
-            cls.storage._DBStorage__session.delete(cls.state)
-            cls.storage._DBStorage__session.delete(cls.city)
-            cls.storage._DBStorage__session.delete(cls.user)
-            cls.storage._DBStorage__session.delete(cls.amenity)
-            cls.storage._DBStorage__session.commit()
-            del cls.state
-            del cls.city
-            del cls.user
-            del cls.place
-            del cls.amenity
-            del cls.review
-            cls.storage._DBStorage__session.close()
-            del cls.storage
+        with patch.dict(os.environ, env):
+            if cls.sqlite is None:
+                return DBStorage()
+            with patch("models.engine.db_storage.create_engine",
+                       lambda url, **kwargs: create_engine(
+                           "sqlite:///" + cls.sqlite, **kwargs)):
+                return DBStorage()
+
+    def execute(self, sql):
+        """Return the rows of sql, run on a connection of its own."""
+        with self.storage._DBStorage__engine.connect() as conn:
+            return conn.execute(text(sql)).fetchall()
 
     def test_pep8(self):
         """Test PEP8 styling."""
@@ -79,22 +119,38 @@ class TestDBStorage(unittest.TestCase):
         self.assertEqual(p.total_errors, 0, "Fix PEP8")
 
     def test_docstrings(self):
-    """Ensure docstrings are present."""
-    self.assertIsNotNone(DBStorage.__doc__)
-    self.assertIsNotNone(DBStorage.__init__.__doc__)
-    self.assertIsNotNone(DBStorage.all.__doc__)
-    self.assertIsNotNone(DBStorage.new.__doc__)
-    self.assertIsNotNone(DBStorage.save.__doc__)
-    self.assertIsNotNone(DBStorage.delete.__doc__)
-    self.assertIsNotNone(DBStorage.reload.__doc__)
-
-    @unittest.skipIf(type(models.storage) == FileStorage,
-                    "Skip test for FileStorage")
+        """Ensure docstrings are present."""
+        self.assertIsNotNone(DBStorage.__doc__)
+        self.assertIsNotNone(DBStorage.__init__.__doc__)
+        self.assertIsNotNone(DBStorage.all.__doc__)
+        self.assertIsNotNone(DBStorage.new.__doc__)
+        self.assertIsNotNone(DBStorage.save.__doc__)
+        self.assertIsNotNone(DBStorage.delete.__doc__)
+        self.assertIsNotNone(DBStorage.reload.__doc__)
+
     def test_attributes(self):
         """Verify the presence of attributes."""
         self.assertTrue(isinstance(self.storage._DBStorage__engine, Engine))
         self.assertTrue(isinstance(self.storage._DBStorage__session, Session))
 
+    def test_pool_stats(self):
+        """Test the connection pool statistics."""
+        self.storage.all(State)
+        stats = self.storage.pool_stats()
+        self.assertEqual(stats["size"], int(getenv("HBNB_MYSQL_POOL_SIZE", 5)))
+        self.assertGreaterEqual(stats["checkouts"], 1)
+        self.assertGreaterEqual(stats["wait_seconds"], 0)
+        self.assertGreaterEqual(stats["overflow"], 0)
+
+    def test_indexes(self):
+        """Verify the lookup indexes declared on the models exist."""
+        inspector = inspect(self.storage._DBStorage__engine)
+        names = {index["name"] for index in inspector.get_indexes("places")}
+        self.assertIn("ix_places_city_id_price_by_night", names)
+        self.assertIn("ix_places_created_at_id", names)
+        names = {index["name"] for index in inspector.get_indexes("cities")}
+        self.assertIn("ix_cities_state_id_name", names)
+
     def test_methods(self):
         """Check for the existence of methods."""
         self.assertTrue(hasattr(DBStorage, "__init__"))
@@ -104,22 +160,16 @@ class TestDBStorage(unittest.TestCase):
         self.assertTrue(hasattr(DBStorage, "delete"))
         self.assertTrue(hasattr(DBStorage, "reload"))
 
-    @unittest.skipIf(type(models.storage) == FileStorage,
-                    "Skip test for FileStorage")
     def test_init(self):
         """Verify successful initialization."""
         self.assertTrue(isinstance(self.storage, DBStorage))
 
-    @unittest.skipIf(type(models.storage) == FileStorage,
-                    "Skip test for FileStorage")
     def test_all(self):
         """Test the default all method."""
         obj = self.storage.all()
         self.assertEqual(type(obj), dict)
         self.assertEqual(len(obj), 6)
 
-    @unittest.skipIf(type(models.storage) == FileStorage,
-                    "Skip test for FileStorage")
     def test_all_cls(self):
         """Test the all method with a specified class."""
         obj = self.storage.all(State)
@@ -127,34 +177,114 @@ class TestDBStorage(unittest.TestCase):
         self.assertEqual(len(obj), 1)
         self.assertEqual(self.state, list(obj.values())[0])
 
-    @unittest.skipIf(type(models.storage) == FileStorage,
-                    "Skip test for FileStorage")
+    def test_all_stats(self):
+        """Test the all method reporting per-class rows and timings."""
+        stats = {}
+        obj = self.storage.all(stats=stats)
+        self.assertEqual(len(obj), 6)
+        self.assertEqual(set(stats), {"State", "City", "User", "Place",
+                                      "Review", "Amenity"})
+        for name in stats:
+            self.assertEqual(stats[name]["rows"], 1)
+            self.assertGreaterEqual(stats[name]["seconds"], 0)
+
+    @unittest.skipIf(type(models.storage) != DBStorage,
+                     "Relationships are properties out of db mode")
+    def test_all_load(self):
+        """Test the all method eager loading named relationships."""
+        obj = self.storage.all(State, load=["cities.places"])
+        state = obj["State." + self.state.id]
+        self.assertIn("cities", state.__dict__)
+        self.assertEqual(state.cities, [self.city])
+        self.assertEqual(state.cities[0].places, [self.place])
+        with self.assertRaises(AttributeError):
+            self.storage.all(State, load=["nothing"])
+
+    def test_iter(self):
+        """Test the iter method."""
+        self.assertEqual(list(self.storage.iter(State)), [self.state])
+        self.assertEqual(list(self.storage.iter("City", chunk_size=1)),
+                         [self.city])
+        self.assertEqual(len(list(self.storage.iter())), 6)
+
+    def test_get(self):
+        """Test the get method."""
+        self.assertIs(self.storage.get(State, self.state.id), self.state)
+        self.assertIs(self.storage.get("User", self.user.id), self.user)
+        self.assertIsNone(self.storage.get(State, "missing"))
+        self.assertIsNone(self.storage.get(BaseModel, self.state.id))
+
+    def test_count(self):
+        """Test the count method."""
+        self.assertEqual(self.storage.count(), 6)
+        self.assertEqual(self.storage.count(State), 1)
+        self.assertEqual(self.storage.count("City"), 1)
+        self.assertEqual(self.storage.count(BaseModel), 0)
+
+    def test_query(self):
+        """Test the query method filters, orders and slices."""
+        obj = self.storage.query(City, state_id=self.state.id)
+        self.assertEqual(list(obj.values()), [self.city])
+        obj = self.storage.query("Place", name__in=["School"],
+                                 order_by="-name", limit=1)
+        self.assertEqual(list(obj.values()), [self.place])
+        self.assertEqual(self.storage.query(Place, offset=1), {})
+        with self.assertRaises(ValueError):
+            self.storage.query(Place, name__like="School")
+
+    def test_page(self):
+        """Test the page method walks (created_at, id) order by cursor."""
+        page, cursor = self.storage.page(State, 1)
+        self.assertEqual(list(page.values()), [self.state])
+        self.assertIsNone(cursor)
+        page, cursor = self.storage.page(City, 1, state_id="none")
+        self.assertEqual((page, cursor), ({}, None))
+        with self.assertRaises(ValueError):
+            self.storage.page(State, 1, "not a cursor")
+        for size in (0, -1):
+            with self.assertRaises(ValueError):
+                self.storage.page(State, size)
+
     def test_new(self):
         """Test the new method."""
         st = State(name="Washington")
         self.storage.new(st)
         store = list(self.storage._DBStorage__session.new)
         self.assertIn(st, store)
+        self.storage._DBStorage__session.expunge(st)
 
-    @unittest.skipIf(type(models.storage) == FileStorage,
-                    "Skip test for FileStorage")
     def test_save(self):
         """Test the save method."""
         st = State(name="Virginia")
         self.storage._DBStorage__session.add(st)
         self.storage.save()
-        db = MySQLdb.connect(user="hbnb_test",
-                            passwd="hbnb_test_pwd",
-                            db="hbnb_test_db")
-        cursor = db.cursor()
-        cursor.execute("SELECT * FROM states WHERE BINARY name = 'Virginia'")
-        query = cursor.fetchall()
+        query = self.execute("SELECT id FROM states WHERE name = 'Virginia'")
         self.assertEqual(1, len(query))
         self.assertEqual(st.id, query[0][0])
-        cursor.close()
+        self.storage.delete(st)
+        self.storage.save()
+
+    def test_bulk_save(self):
+        """Test the bulk_save method."""
+        states = [State(name="Bulk_{}".format(i)) for i in range(3)]
+        self.storage.bulk_save(states)
+        query = self.execute(
+            "SELECT COUNT(*) FROM states WHERE name LIKE 'Bulk_%'")
+        self.assertEqual(3, query[0][0])
+        for state in states:
+            self.storage.delete(state)
+        self.storage.save()
+
+    def test_batch_rollback(self):
+        """Test that a failing batch rolls its saves back."""
+        with self.assertRaises(RuntimeError):
+            with self.storage.batch():
+                st = State(name="Oregon")
+                self.storage.new(st)
+                self.storage.save()
+                raise RuntimeError()
+        self.assertEqual(self.storage.query(State, name="Oregon"), {})
 
-    @unittest.skipIf(type(models.storage) == FileStorage,
-                    "Skip test for FileStorage")
     def test_delete(self):
         """Test the delete method."""
         st = State(name="New_York")
@@ -162,9 +292,8 @@ class TestDBStorage(unittest.TestCase):
         self.storage._DBStorage__session.commit()
         self.storage.delete(st)
         self.assertIn(st, list(self.storage._DBStorage__session.deleted))
+        self.storage.save()
 
-    @unittest.skipIf(type(models.storage) == FileStorage,
-                    "Skip test for FileStorage")
     def test_delete_none(self):
         """Test the delete method with None."""
         try:
@@ -172,8 +301,152 @@ class TestDBStorage(unittest.TestCase):
         except Exception:
             self.fail
 
-    @unittest.skipIf(type(models.storage) == FileStorage,
-                    "Skip test for FileStorage")
+    def test_cache(self):
+        """Test that results are cached until their classes change."""
+        self.storage._DBStorage__cache_ttl = 60
+        before = self.storage.cache_stats()
+        try:
+            count = self.storage.count(State)
+            self.assertEqual(self.storage.count(State), count)
+            stats = self.storage.cache_stats()
+            self.assertEqual(stats["hits"] - before["hits"], 1)
+            self.assertEqual(stats["misses"] - before["misses"], 1)
+            self.storage.new(City(name="Cached", state_id=self.state.id))
+            self.assertEqual(self.storage.count(State), count)
+            self.assertEqual(self.storage.cache_stats()["hits"] -
+                             before["hits"], 2)
+            self.storage.new(State(name="Cached"))
+            self.assertEqual(self.storage.count(State), count + 1)
+            self.assertEqual(self.storage.cache_stats()["misses"] -
+                             before["misses"], 2)
+        finally:
+            self.storage._DBStorage__cache_ttl = 0
+            self.storage._DBStorage__session.rollback()
+            self.storage._DBStorage__cache.clear()
+
+    def test_cache_copies(self):
+        """Test that changing a returned result leaves the cache intact."""
+        self.storage._DBStorage__cache_ttl = 60
+        try:
+            self.storage.all(State).clear()
+            self.assertEqual(len(self.storage.all(State)), 1)
+            self.storage.all(State).clear()
+            self.assertEqual(len(self.storage.all(State)), 1)
+        finally:
+            self.storage._DBStorage__cache_ttl = 0
+            self.storage._DBStorage__cache.clear()
+
+    @unittest.skipIf(type(models.storage) != DBStorage,
+                     "Relationships are properties out of db mode")
+    def test_cache_load_invalidation(self):
+        """Test that every loaded relationship invalidates a result."""
+        self.storage._DBStorage__cache_ttl = 60
+        before = self.storage.cache_stats()
+        try:
+            for name in ("Review", "Amenity"):
+                self.storage.all(Place, load=["reviews", "amenities"])
+                self.storage.touch(self.amenity if name == "Amenity"
+                                   else self.review, "name")
+            self.storage.all(Place, load=["reviews", "amenities"])
+            stats = self.storage.cache_stats()
+            self.assertEqual(stats["misses"] - before["misses"], 3)
+            self.assertEqual(stats["hits"] - before["hits"], 0)
+        finally:
+            self.storage._DBStorage__cache_ttl = 0
+            self.storage._DBStorage__cache.clear()
+
+    @unittest.skipIf(type(models.storage) != DBStorage,
+                     "Relationships are properties out of db mode")
+    def test_cache_load(self):
+        """Test that a cache hit keeps the relationships eager loaded."""
+        self.storage._DBStorage__cache_ttl = 60
+        histogram = HistogramSink()
+        session = self.storage._DBStorage__session
+        try:
+            self.storage.all(State, load=["cities.places"])
+            self.storage._DBStorage__session = sessionmaker(
+                bind=self.storage._DBStorage__engine)()
+            self.storage.metrics = Metrics([histogram])
+            obj = self.storage.all(State, load=["cities.places"])
+            state = obj["State." + self.state.id]
+            self.assertEqual([c.id for c in state.cities], [self.city.id])
+            self.assertEqual([p.id for p in state.cities[0].places],
+                             [self.place.id])
+            self.assertNotIn("sql", histogram.snapshot())
+        finally:
+            self.storage.metrics = Metrics()
+            self.storage._DBStorage__cache_ttl = 0
+            self.storage._DBStorage__cache.clear()
+            self.storage._DBStorage__session.close()
+            self.storage._DBStorage__session = session
+
+    def test_cache_versions(self):
+        """Test that cached results follow the shared version file."""
+        self.storage._DBStorage__cache_ttl = 60
+        self.storage._DBStorage__versions = "versions.json"
+        before = self.storage.cache_stats()
+        try:
+            self.storage.count(State)
+            bump_versions("versions.json", ["City"])
+            self.storage.count(State)
+            self.assertEqual(self.storage.cache_stats()["hits"] -
+                             before["hits"], 1)
+            bump_versions("versions.json", ["State"])
+            self.storage.count(State)
+            self.assertEqual(self.storage.cache_stats()["misses"] -
+                             before["misses"], 2)
+            st = State(name="Versioned")
+            self.storage.new(st)
+            self.storage.save()
+            self.assertEqual(read_versions("versions.json")["State"], 2)
+            self.storage.delete(st)
+            self.storage.save()
+        finally:
+            self.storage._DBStorage__cache_ttl = 0
+            self.storage._DBStorage__versions = None
+            self.storage._DBStorage__cache.clear()
+            os.remove("versions.json")
+
+    def test_metrics(self):
+        """Test that calls and their SQL statements are measured."""
+        histogram = HistogramSink()
+        self.storage.metrics = Metrics([histogram])
+        try:
+            self.storage.all(State)
+            stats = histogram.snapshot()
+            self.assertEqual(stats["all"]["count"], 1)
+            self.assertEqual(stats["all"]["rows"],
+                             len(self.storage.all(State)))
+            self.assertGreaterEqual(stats["sql"]["count"], 1)
+        finally:
+            self.storage.metrics = Metrics()
+
+    @unittest.skipIf(type(models.storage) == DBStorage and
+                     not getenv("HBNB_MYSQL_REPLICAS"),
+                     "Skip test without read replicas")
+    def test_replica_routing(self):
+        """Test that reads go to a replica until the session writes.
+
+        Out of db mode, the replica is a second engine on the SQLite file.
+        """
+        if self.sqlite is None:
+            storage = self.connect()
+        else:
+            storage = self.connect(HBNB_MYSQL_REPLICAS="replica")
+        storage.reload()
+        replica = storage._DBStorage__replica
+        self.assertIs(storage._DBStorage__reader(), replica)
+        st = State(name="Replicated")
+        storage.new(st)
+        self.assertIs(storage._DBStorage__reader(),
+                      storage._DBStorage__session)
+        self.assertIs(storage.get(State, st.id), st)
+        storage.delete(st)
+        storage.save()
+        storage.close()
+        self.assertIsNot(storage._DBStorage__reader(),
+                         storage._DBStorage__session)
+
     def test_reload(self):
         """Test the reload method."""
         og_session = self.storage._DBStorage__session
@@ -183,5 +456,6 @@ class TestDBStorage(unittest.TestCase):
         self.storage._DBStorage__session.close()
         self.storage._DBStorage__session = og_session
 
+
 if __name__ == "__main__":
     unittest.main()
@@ -6,6 +6,8 @@ import json
 import pep8
 import unittest
 from datetime import datetime
+from tempfile import mkstemp
+from unittest.mock import patch
 from models.base_model import BaseModel
 from models.user import User
 from models.state import State
@@ -13,7 +15,12 @@ from models.city import City
 from models.amenity import Amenity
 from models.place import Place
 from models.review import Review
+from models.engine import bump_versions
+from models.engine import read_versions
 from models.engine.file_storage import FileStorage
+from models.engine.metrics import HistogramSink
+from models.engine.metrics import LogSink
+from models.engine.metrics import Metrics
 
 
 class TestFileStorage(unittest.TestCase):
@@ -31,6 +38,7 @@ class TestFileStorage(unittest.TestCase):
             os.rename("file.json", "tmp")
         except IOError:
             pass
+        cls.saved = cls.snapshot()
         FileStorage._FileStorage__objects = {}
         cls.storage = FileStorage()
         cls.base = BaseModel()
@@ -54,18 +62,21 @@ class TestFileStorage(unittest.TestCase):
         cls.review = Review()
         key = "{}.{}".format(type(cls.review).__name__, cls.review.id)
         FileStorage._FileStorage__objects[key] = cls.review
+        cls.fixtures = cls.snapshot()
 
     @classmethod
     def tearDownClass(cls):
         """Clean up after FileStorage testing.
 
-        Restore the original file.json.
+        Restore the original file.json and FileStorage state.
         Delete all instances of test classes.
         """
-        try:
-            os.remove("file.json")
-        except IOError:
-            pass
+        cls.restore(cls.saved)
+        for path in ("file.json", "file.json.journal"):
+            try:
+                os.remove(path)
+            except IOError:
+                pass
         try:
             os.rename("tmp", "file.json")
         except IOError:
@@ -79,6 +90,27 @@ class TestFileStorage(unittest.TestCase):
         del cls.amenity
         del cls.review
 
+    def setUp(self):
+        """Start each test from the objects created in setUpClass."""
+        self.restore(self.fixtures)
+
+    @staticmethod
+    def snapshot():
+        """Return a copy of every FileStorage class attribute."""
+        return {name: dict(value) if isinstance(value, dict) else value
+                for name, value in vars(FileStorage).items()
+                if name.startswith("_FileStorage__") and
+                not isinstance(value, (staticmethod, classmethod)) and
+                not callable(value)}
+
+    @staticmethod
+    def restore(state):
+        """Set the FileStorage class attributes back to a snapshot."""
+        for name, value in state.items():
+            if isinstance(value, dict):
+                value = dict(value)
+            setattr(FileStorage, name, value)
+
     def test_pep8_FileStorage(self):
         """Verify adherence to PEP8 styling."""
         style = pep8.StyleGuide(quiet=True)
@@ -123,6 +155,130 @@ class TestFileStorage(unittest.TestCase):
         self.assertEqual(len(obj), 1)
         self.assertEqual(self.base, list(obj.values())[0])
 
+    def test_all_cls_string(self):
+        """Test the all method with a class name."""
+        obj = self.storage.all("State")
+        self.assertEqual(len(obj), 1)
+        self.assertIs(obj, self.storage.all(State))
+
+    def test_all_load(self):
+        """Test that all accepts the load argument of DBStorage."""
+        self.assertIs(self.storage.all(State, load=["cities"]),
+                      self.storage.all(State))
+
+    def test_iter(self):
+        """Test the iter method."""
+        self.assertEqual(list(self.storage.iter(State)), [self.state])
+        self.assertEqual(list(self.storage.iter("Review", chunk_size=1)),
+                         [self.review])
+        self.assertEqual(list(self.storage.iter()),
+                         list(self.storage.all().values()))
+
+    def test_get(self):
+        """Test the get method."""
+        self.assertIs(self.storage.get(State, self.state.id), self.state)
+        self.assertIs(self.storage.get("User", self.user.id), self.user)
+        self.assertIsNone(self.storage.get(State, self.user.id))
+        self.assertIsNone(self.storage.get("State", "missing"))
+
+    def test_count(self):
+        """Test the count method."""
+        self.assertEqual(self.storage.count(), len(self.storage.all()))
+        self.assertEqual(self.storage.count(State), 1)
+        self.assertEqual(self.storage.count("Review"), 1)
+        state = State()
+        self.storage.new(state)
+        self.assertEqual(self.storage.count("State"), 2)
+        self.storage.delete(state)
+        self.assertEqual(self.storage.count(State), 1)
+
+    def test_query(self):
+        """Test the query method filters, orders and slices."""
+        places = [Place(name="Place {}".format(i), price_by_night=i * 10,
+                        city_id=self.city.id) for i in range(5)]
+        for place in places:
+            self.storage.new(place)
+        found = self.storage.query(Place, price_by_night__gte=10,
+                                   price_by_night__lt=40)
+        self.assertEqual(list(found.values()), places[1:4])
+        found = self.storage.query("Place", city_id=self.city.id,
+                                   order_by="-price_by_night",
+                                   limit=2, offset=1)
+        self.assertEqual(list(found.values()), [places[3], places[2]])
+        found = self.storage.query(City, state_id__in=["none"])
+        self.assertEqual(found, {})
+        with self.assertRaises(ValueError):
+            self.storage.query(Place, name__like="Place")
+
+    def test_query_place_city_index(self):
+        """Test that a city_id filter on Place starts from its index."""
+        place = Place(name="Indexed", city_id=self.city.id)
+        self.storage.new(place)
+        with patch.object(FileStorage, "all") as scan:
+            found = self.storage.query(Place, city_id=self.city.id)
+            self.assertEqual(list(found.values()), [place])
+            found, _ = self.storage.page(Place, 10, city_id="none")
+            self.assertEqual(found, {})
+        scan.assert_not_called()
+        place.city_id = "moved"
+        self.assertEqual(self.storage.query(Place, city_id="moved"),
+                         {"Place." + place.id: place})
+
+    def test_page(self):
+        """Test the page method walks (created_at, id) order by cursor."""
+        amenities = [Amenity(name="Amenity {}".format(i)) for i in range(5)]
+        for i, amenity in enumerate(amenities):
+            amenity.created_at = datetime(2017, 1, 1 + i % 2)
+            self.storage.new(amenity)
+        seen, cursor = [], None
+        while True:
+            page, cursor = self.storage.page(Amenity, 2, cursor,
+                                             name__in=["Amenity 1",
+                                                       "Amenity 2",
+                                                       "Amenity 4"])
+            self.assertLessEqual(len(page), 2)
+            seen.extend(page.values())
+            if cursor is None:
+                break
+        expected = sorted([amenities[1], amenities[2], amenities[4]],
+                          key=lambda a: (a.created_at, a.id))
+        self.assertEqual(seen, expected)
+        with self.assertRaises(ValueError):
+            self.storage.page(Amenity, 2, "not a cursor")
+        for size in (0, -1):
+            with self.assertRaises(ValueError):
+                self.storage.page(Amenity, size)
+
+    def test_all_cls_tracks_new_delete(self):
+        """Test that all(cls) follows new and delete."""
+        state = State()
+        self.storage.new(state)
+        self.assertIn("State." + state.id, self.storage.all(State))
+        self.storage.delete(state)
+        self.assertNotIn("State." + state.id, self.storage.all(State))
+        self.assertEqual(list(self.storage.all(Review).values()),
+                         [self.review])
+
+    def test_related(self):
+        """Test the related method on an indexed foreign key."""
+        city = City(state_id=self.state.id)
+        self.storage.new(city)
+        self.assertEqual(self.storage.related(City, "state_id",
+                                              self.state.id), [city])
+        self.storage.delete(city)
+        self.assertEqual(self.storage.related(City, "state_id",
+                                              self.state.id), [])
+
+    def test_related_follows_update(self):
+        """Test that related follows assignments to a foreign key."""
+        review = Review(place_id="old")
+        self.storage.new(review)
+        review.place_id = self.place.id
+        self.assertEqual(self.storage.related(Review, "place_id", "old"), [])
+        self.assertEqual(self.storage.related(Review, "place_id",
+                                              self.place.id), [review])
+        self.storage.delete(review)
+
     def test_new(self):
         """Test the new method."""
         bm = BaseModel()
@@ -144,6 +300,85 @@ class TestFileStorage(unittest.TestCase):
             self.assertIn("Amenity." + self.amenity.id, save_text)
             self.assertIn("Review." + self.review.id, save_text)
 
+    def test_bulk_save(self):
+        """Test that bulk_save stores and writes all objects at once."""
+        places = [Place(name="Place {}".format(i)) for i in range(3)]
+        with patch("models.engine.file_storage.mkstemp",
+                   wraps=mkstemp) as written:
+            self.storage.bulk_save(places)
+        self.assertEqual(written.call_count, 1)
+        with open("file.json", "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        for place in places:
+            self.assertIs(self.storage.get(Place, place.id), place)
+            self.assertIn("Place." + place.id, saved)
+
+    def test_batch(self):
+        """Test that batch defers the saves made in it to its end."""
+        state = State(name="Batched")
+        with patch.object(FileStorage, "_FileStorage__compact",
+                          wraps=self.storage._FileStorage__compact) as write:
+            with self.storage.batch():
+                calls = write.call_count
+                state.save()
+                state.name = "Renamed"
+                state.save()
+                self.assertEqual(write.call_count, calls)
+            self.assertEqual(write.call_count, calls + 1)
+        with open("file.json", "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["State." + state.id]["name"],
+                             "Renamed")
+
+    def test_batch_rollback(self):
+        """Test that a failing batch restores the objects as saved."""
+        keys = sorted(self.storage.all())
+        state = State(name="Lost")
+        self.addCleanup(self.user.__dict__.pop, "email", None)
+        self.storage.save()
+        with self.assertRaises(RuntimeError):
+            with self.storage.batch():
+                state.save()
+                self.storage.all()["User." + self.user.id].email = "x"
+                raise RuntimeError()
+        self.assertNotIn("State." + state.id, self.storage.all())
+        user = self.storage.get(User, self.user.id)
+        self.assertIsNot(user, self.user)
+        self.assertNotEqual(user.email, "x")
+        self.assertEqual(sorted(self.storage.all()), keys)
+
+    def test_batch_rollback_after_subset_reload(self):
+        """Test that a rollback keeps the classes held before it."""
+        storage = FileStorage()
+        storage.save()
+        FileStorage._FileStorage__objects = {}
+        storage.reload(["State"])
+        storage.new(City())
+        storage.save()
+        with self.assertRaises(RuntimeError):
+            with storage.batch():
+                raise RuntimeError()
+        self.assertIn("City." + self.city.id, storage.all(City))
+        storage.new(State())
+        storage.save()
+        with open("file.json", "r", encoding="utf-8") as f:
+            self.assertIn("City." + self.city.id, json.load(f))
+
+    def test_save_reuses_clean_objects(self):
+        """Test that save only serializes objects changed since last save."""
+        user = User()
+        self.storage.new(user)
+        self.storage.save()
+        user.first_name = "Betty"
+        with patch.object(BaseModel, "to_dict",
+                          autospec=True, side_effect=BaseModel.to_dict) as m:
+            self.storage.save()
+        self.assertEqual([call[0][0] for call in m.call_args_list], [user])
+        with open("file.json", "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        self.assertEqual(saved["User." + user.id]["first_name"], "Betty")
+        self.assertEqual(len(saved), len(self.storage.all()))
+        self.storage.delete(user)
+
     def test_reload(self):
         """Test the reload method."""
         bm = BaseModel()
@@ -154,6 +389,56 @@ class TestFileStorage(unittest.TestCase):
         store = FileStorage._FileStorage__objects
         self.assertIn("BaseModel." + bm.id, store)
 
+    def test_save_after_reload_reuses_texts(self):
+        """Test that a save right after reload serializes no object."""
+        state = State(name="Île-de-France")
+        self.storage.new(state)
+        self.storage.save()
+        with open("file.json", "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        fragments = FileStorage._FileStorage__fragments
+        for key in self.storage.all():
+            self.assertEqual(len(fragments[key]), 4)
+        with patch.object(BaseModel, "to_dict", autospec=True,
+                          side_effect=BaseModel.to_dict) as m:
+            self.storage.save()
+            self.storage.save()
+        m.assert_not_called()
+        with open("file.json", "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f), saved)
+
+    def test_save_after_file_replaced(self):
+        """Test that objects are serialized if their file was replaced."""
+        self.storage.save()
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        with open("file.json", "r", encoding="utf-8") as f:
+            text = f.read()
+        os.remove("file.json")
+        with open("file.json", "w", encoding="utf-8") as f:
+            f.write(" " * 100 + text)
+        self.storage.save()
+        with open("file.json", "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f), json.loads(text))
+
+    def test_reload_progress(self):
+        """Test that reload reports the objects and bytes it read."""
+        bm = BaseModel()
+        user = User(first_name="Zoë")
+        with open("file.json", "w", encoding="utf-8") as f:
+            json.dump({"BaseModel." + bm.id: bm.to_dict(),
+                       "User." + user.id: user.to_dict()}, f,
+                      ensure_ascii=False)
+        calls = []
+        self.storage.reload(progress=lambda *args: calls.append(args))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(calls[0][0], 2)
+        # every byte but the closing brace
+        self.assertEqual(calls[0][1], os.path.getsize("file.json") - 1)
+        self.assertIn("BaseModel." + bm.id, self.storage.all())
+
     def test_reload_no_file(self):
         """Test the reload method with no existing file.json."""
         try:
@@ -161,6 +446,83 @@ class TestFileStorage(unittest.TestCase):
         except Exception:
             self.fail
 
+    def test_reload_unchanged_file(self):
+        """Test that reload skips parsing a file it already holds."""
+        self.storage.save()
+        with patch("builtins.open", wraps=open) as opened:
+            self.storage.reload()
+            self.storage.close()
+        opened.assert_not_called()
+
+    def test_reload_changed_file(self):
+        """Test that reload reads the file again once it changed."""
+        self.storage.save()
+        bm = BaseModel()
+        with open("file.json", "w", encoding="utf-8") as f:
+            json.dump({"BaseModel." + bm.id: bm.to_dict()}, f)
+        self.storage.close()
+        self.assertIn("BaseModel." + bm.id, self.storage.all())
+
+    @patch.dict(os.environ, {"HBNB_STORAGE_VERSIONS": "file.json.versions"})
+    def test_reload_changed_versions(self):
+        """Test that reload only reads back the classes another process
+        bumped in the version file."""
+        self.addCleanup(os.remove, "file.json.versions")
+        storage = FileStorage()
+        storage.save()
+        storage.close()
+        state = State()
+        with open("file.json", "r", encoding="utf-8") as f:
+            objs = json.load(f)
+        objs["State." + state.id] = state.to_dict()
+        with open("file.json", "w", encoding="utf-8") as f:
+            json.dump(objs, f)
+        with patch("builtins.open", wraps=open) as opened:
+            storage.close()
+        self.assertNotIn("file.json", [c[0][0] for c in opened.call_args_list])
+        self.assertNotIn("State." + state.id, storage.all())
+        bump_versions("file.json.versions", ["State"])
+        storage.close()
+        self.assertIn("State." + state.id, storage.all())
+        self.assertIs(storage.all()["City." + self.city.id], self.city)
+        self.assertIsNot(storage.all()["State." + self.state.id], self.state)
+        storage.delete(storage.all()["State." + state.id])
+        storage.save()
+        self.assertEqual(read_versions("file.json.versions")["State"], 2)
+
+    def test_metrics(self):
+        """Test that calls are measured with their rows and bytes."""
+        histogram = HistogramSink()
+        storage = FileStorage()
+        storage.metrics = Metrics([histogram], slow=0)
+        storage.save()
+        storage.all(State)
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        loaded = len(FileStorage._FileStorage__objects)
+        stats = histogram.snapshot()
+        self.assertEqual(stats["save"]["count"], 1)
+        self.assertEqual(stats["save"]["bytes"],
+                         os.path.getsize("file.json"))
+        self.assertEqual(stats["all"]["rows"], len(storage.all(State)))
+        self.assertEqual(stats["reload"]["rows"], loaded)
+        self.assertGreater(stats["reload"]["bytes"], 0)
+        self.assertEqual(stats["save"]["slow"], 1)
+        self.assertIn('hbnb_storage_call_seconds_count{call="save"} 1',
+                      histogram.prometheus())
+
+    def test_metrics_log(self):
+        """Test that the log sink warns about slow calls only."""
+        storage = FileStorage()
+        storage.metrics = Metrics([LogSink()], slow=60)
+        with self.assertLogs("hbnb.storage", "DEBUG") as logs:
+            storage.all()
+            storage.metrics.slow = 0
+            storage.count()
+        self.assertEqual([record.levelname for record in logs.records],
+                         ["DEBUG", "WARNING"])
+        self.assertTrue(logs.records[1].getMessage().startswith("slow count"))
+
     def test_delete(self):
         """Test the delete method."""
         bm = BaseModel()
@@ -176,6 +538,245 @@ class TestFileStorage(unittest.TestCase):
         except Exception:
             self.fail
 
+    @patch.dict(os.environ, {"HBNB_FILE_JOURNAL": "1"})
+    def test_save_journaled(self):
+        """Test that journaled saves append records instead of rewriting."""
+        self.addCleanup(os.remove, "file.json.journal")
+        storage = FileStorage()
+        bm = BaseModel()
+        storage.new(bm)
+        storage.save()
+        storage.delete(bm)
+        storage.save()
+        with open("file.json.journal", "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(records[-2]["key"], "BaseModel." + bm.id)
+        self.assertEqual(records[-2]["obj"]["id"], bm.id)
+        self.assertEqual(records[-1], {"key": "BaseModel." + bm.id})
+
+    @patch.dict(os.environ, {"HBNB_FILE_JOURNAL": "1"})
+    def test_reload_journaled(self):
+        """Test that reload replays the journal on top of the snapshot."""
+        self.addCleanup(os.remove, "file.json.journal")
+        storage = FileStorage()
+        kept = BaseModel()
+        gone = BaseModel()
+        storage.new(kept)
+        storage.new(gone)
+        storage.save()
+        storage.delete(gone)
+        storage.save()
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        store = FileStorage._FileStorage__objects
+        self.assertIn("BaseModel." + kept.id, store)
+        self.assertNotIn("BaseModel." + gone.id, store)
+        self.assertEqual(store["BaseModel." + kept.id].created_at,
+                         kept.created_at)
+
+    @patch.dict(os.environ, {"HBNB_FILE_JOURNAL": "1"})
+    def test_reload_journaled_torn_record(self):
+        """Test that saves after a torn journal record are not lost."""
+        self.addCleanup(os.remove, "file.json.journal")
+        storage = FileStorage()
+        storage.save()
+        with open("file.json.journal", "a", encoding="utf-8") as f:
+            f.write('{"key": "State.torn", "obj": {"na')
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        state = State()
+        storage.new(state)
+        storage.save()
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        self.assertIn("State." + state.id, storage.all())
+        self.assertNotIn("State.torn", storage.all())
+        with open("file.json.journal", "r", encoding="utf-8") as f:
+            self.assertTrue(f.read().endswith("\n"))
+
+    @patch.dict(os.environ, {"HBNB_FILE_JOURNAL": "1"})
+    def test_reload_journaled_partial_append(self):
+        """Test that reload leaves a record being appended untouched."""
+        self.addCleanup(os.remove, "file.json.journal")
+        storage = FileStorage()
+        storage.save()
+        state = State()
+        line = json.dumps({"key": "State." + state.id,
+                           "obj": state.to_dict()}) + "\n"
+        with open("file.json.journal", "a", encoding="utf-8") as f:
+            f.write(line[:20])
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        with open("file.json.journal", "a", encoding="utf-8") as f:
+            f.write(line[20:])
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        self.assertIn("State." + state.id, storage.all())
+
+    @patch.dict(os.environ, {"HBNB_FILE_JOURNAL": "1"})
+    def test_save_journaled_after_torn_record(self):
+        """Test that a save ends a torn record before appending."""
+        self.addCleanup(os.remove, "file.json.journal")
+        storage = FileStorage()
+        with open("file.json.journal", "w", encoding="utf-8") as f:
+            f.write('{"key": "State.torn", "obj": {"na')
+        bm = BaseModel()
+        storage.new(bm)
+        storage.save()
+        storage.delete(bm)
+        storage.save()
+        with open("file.json.journal", "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        self.assertEqual(json.loads(lines[1])["key"], "BaseModel." + bm.id)
+        self.assertEqual(json.loads(lines[2]), {"key": "BaseModel." + bm.id})
+
+    def test_save_temporary_files(self):
+        """Test that each save writes a temporary file of its own."""
+        self.storage.save()
+        with open("file.json", "r", encoding="utf-8") as f:
+            saved = f.read()
+        with open("file.json.tmp", "w", encoding="utf-8") as f:
+            f.write("another process")
+        self.addCleanup(os.remove, "file.json.tmp")
+        with patch("models.engine.file_storage.os.replace",
+                   side_effect=OSError):
+            with self.assertRaises(OSError):
+                self.storage.save()
+        self.assertEqual([name for name in os.listdir(".")
+                          if name.startswith("file.json.")],
+                         ["file.json.tmp"])
+        with open("file.json.tmp", "r", encoding="utf-8") as f:
+            self.assertEqual(f.read(), "another process")
+        with open("file.json", "r", encoding="utf-8") as f:
+            self.assertEqual(f.read(), saved)
+
+    @patch.dict(os.environ, {"HBNB_FILE_JOURNAL": "1",
+                             "HBNB_FILE_JOURNAL_MAX": "0"})
+    def test_save_journaled_compaction(self):
+        """Test that an oversized journal is folded into the snapshot."""
+        storage = FileStorage()
+        bm = BaseModel()
+        storage.new(bm)
+        storage.save()
+        self.assertFalse(os.path.exists("file.json.journal"))
+        with open("file.json", "r", encoding="utf-8") as f:
+            self.assertIn("BaseModel." + bm.id, json.load(f))
+
+    @patch.dict(os.environ, {"HBNB_FILE_JOURNAL": "1",
+                             "HBNB_FILE_JOURNAL_MAX": "500"})
+    def test_save_journaled_compaction_keeps_others(self):
+        """Test that compaction keeps records other processes appended."""
+        storage = FileStorage()
+        storage.save()
+        states = [State(), State(name="x" * 500)]
+        storage.new(states[0])
+        storage.save()
+        city = City(name="Appended")
+        with open("file.json.journal", "a", encoding="utf-8") as f:
+            f.write(json.dumps({"key": "City." + city.id,
+                                "obj": city.to_dict()}) + "\n")
+        storage.new(states[1])
+        storage.save()
+        self.assertFalse(os.path.exists("file.json.journal"))
+        with open("file.json", "r", encoding="utf-8") as f:
+            self.assertIn("City." + city.id, json.load(f))
+        self.assertEqual(storage.get(City, city.id).name, "Appended")
+
+    @patch.dict(os.environ, {"HBNB_FILE_LAZY": "1"})
+    def test_reload_lazy(self):
+        """Test that a lazy reload only builds objects when reached."""
+        storage = FileStorage()
+        storage.save()
+        objects = FileStorage._FileStorage__objects
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        records = FileStorage._FileStorage__records
+        self.assertEqual(FileStorage._FileStorage__objects, {})
+        self.assertIn("City." + self.city.id, records["City"])
+        self.assertEqual(storage.count(), len(objects))
+        self.assertEqual(storage.count(City), 1)
+        self.assertEqual([o.id for o in storage.iter(User)],
+                         [self.user.id])
+        self.assertNotIn("User", records)
+        cities = storage.all(City)
+        self.assertEqual(list(cities), ["City." + self.city.id])
+        self.assertIsInstance(cities["City." + self.city.id], City)
+        self.assertNotIn("City", records)
+        storage.save()
+        with open("file.json", "r", encoding="utf-8") as f:
+            self.assertEqual(sorted(json.load(f)), sorted(objects))
+        self.assertEqual(sorted(storage.all()), sorted(objects))
+        self.assertEqual(records, {})
+
+    def remove_shards(self):
+        """Remove the shard files written in sharded mode."""
+        for name in ("BaseModel", "User", "State", "City", "Amenity",
+                     "Place", "Review"):
+            try:
+                os.remove("file.{}.json".format(name))
+            except IOError:
+                pass
+
+    @patch.dict(os.environ, {"HBNB_FILE_SHARDED": "1"})
+    def test_save_sharded(self):
+        """Test that a sharded save only rewrites the changed classes."""
+        self.addCleanup(self.remove_shards)
+        storage = FileStorage()
+        storage.save()
+        with open("file.User.json", "r", encoding="utf-8") as f:
+            self.assertEqual(sorted(json.load(f)),
+                             sorted(self.storage.all(User)))
+        user_stat = os.stat("file.User.json")
+        state = State()
+        storage.new(state)
+        storage.save()
+        self.assertEqual(os.stat("file.User.json"), user_stat)
+        with open("file.State.json", "r", encoding="utf-8") as f:
+            self.assertIn("State." + state.id, json.load(f))
+        storage.delete(state)
+        storage.save()
+
+    @patch.dict(os.environ, {"HBNB_FILE_SHARDED": "1"})
+    def test_reload_sharded_classes(self):
+        """Test that a sharded reload can be limited to some classes."""
+        self.addCleanup(self.remove_shards)
+        storage = FileStorage()
+        storage.save()
+        FileStorage._FileStorage__objects = {}
+        storage.reload(["State", "Amenity"])
+        self.assertEqual(sorted(storage.all()),
+                         sorted(["State." + self.state.id,
+                                 "Amenity." + self.amenity.id]))
+
+    def test_save_after_subset_reload(self):
+        """Test that saving after a subset reload keeps the other classes."""
+        storage = FileStorage()
+        storage.save()
+        FileStorage._FileStorage__objects = {}
+        storage.reload(["State"])
+        storage.new(State())
+        storage.save()
+        with open("file.json", "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        self.assertIn("City." + self.city.id, saved)
+        self.assertIn("User." + self.user.id, saved)
+
+    @patch.dict(os.environ, {"HBNB_FILE_SHARDED": "1"})
+    def test_save_sharded_after_subset_reload(self):
+        """Test that saving a class left out of a reload keeps its shard."""
+        self.addCleanup(self.remove_shards)
+        storage = FileStorage()
+        storage.save()
+        FileStorage._FileStorage__objects = {}
+        storage.reload(["State"])
+        city = City()
+        storage.new(city)
+        storage.save()
+        with open("file.City.json", "r", encoding="utf-8") as f:
+            self.assertEqual(sorted(json.load(f)),
+                             sorted(["City." + self.city.id,
+                                     "City." + city.id]))
+
 
 if __name__ == "__main__":
     unittest.main()
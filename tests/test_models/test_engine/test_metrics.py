@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+"""Defines unit tests for models/engine/metrics.py."""
+
+import pep8
+import unittest
+from threading import Barrier
+from threading import Thread
+from models.engine.metrics import Metrics
+
+
+class TestMetrics(unittest.TestCase):
+    """Unittests for testing the Metrics class."""
+
+    def test_pep8(self):
+        """Test pep8 styling."""
+        style = pep8.StyleGuide(quiet=True)
+        p = style.check_files(["models/engine/metrics.py"])
+        self.assertEqual(p.total_errors, 0, "fix pep8")
+
+    def test_docstrings(self):
+        """Check for docstrings."""
+        self.assertIsNotNone(Metrics.__doc__)
+        self.assertIsNotNone(Metrics.add.__doc__)
+        self.assertIsNotNone(Metrics.timed.__doc__)
+
+    def test_threads(self):
+        """Test that calls of concurrent threads keep their own fields."""
+        metrics = Metrics([lambda measure: None])
+        started = Barrier(2)
+        results = {}
+
+        def call(rows):
+            def method():
+                started.wait()
+                metrics.add(rows=rows)
+                started.wait()
+            results[rows] = metrics.timed(method)[2]
+
+        threads = [Thread(target=call, args=(rows,)) for rows in (1, 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, {1: {"rows": 1}, 2: {"rows": 2}})
+
+
+if __name__ == "__main__":
+    unittest.main()
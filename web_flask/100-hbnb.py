@@ -5,22 +5,49 @@ This script starts a Flask web application.
 The application is configured to listen on 0.0.0.0, port 5000.
 Routes:
     /hbnb: Renders the main HBnB home page.
+        Places can be narrowed with the query parameters city_id,
+        price_min, price_max and guests. They are listed limit at a time
+        (PAGE_SIZE by default); the page after is fetched by passing back
+        the cursor handed to the template as next_cursor.
 """
 from models import storage
 from flask import Flask
+from flask import abort
+from flask import request
 from flask import render_template
 
 app = Flask(__name__)
+PAGE_SIZE = 100
 
 
 @app.route("/hbnb", strict_slashes=False)
 def hbnb():
-    """Renders the main HBnB home page."""
+    """Renders the main HBnB home page.
+
+    The place filters are pushed down to the storage engine, so only the
+    page of places displayed is loaded.
+    """
+    filters = {}
+    for param, name, kind in (("city_id", "city_id", str),
+                              ("price_min", "price_by_night__gte", int),
+                              ("price_max", "price_by_night__lte", int),
+                              ("guests", "max_guest__gte", int)):
+        value = request.args.get(param, type=kind)
+        if value is not None:
+            filters[name] = value
     states = storage.all("State")
     amenities = storage.all("Amenity")
-    places = storage.all("Place")
+    size = request.args.get("limit", PAGE_SIZE, type=int)
+    size = max(1, min(size, PAGE_SIZE))
+    try:
+        places, next_cursor = storage.page("Place", size,
+                                           request.args.get("cursor"),
+                                           **filters)
+    except ValueError:
+        abort(400)
     return render_template("100-hbnb.html",
-                           states=states, amenities=amenities, places=places)
+                           states=states, amenities=amenities, places=places,
+                           next_cursor=next_cursor)
 
 
 @app.teardown_appcontext
@@ -19,7 +19,7 @@ def cities_by_states():
 
     The list is sorted by state and city names.
     """
-    states = storage.all("State")
+    states = storage.all("State", load=["cities"])
     return render_template("8-cities_by_states.html", states=states)
 
 
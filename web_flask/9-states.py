@@ -20,16 +20,16 @@ def states():
 
     The list is sorted by state name.
     """
-    states = storage.all("State")
+    states = storage.all("State", load=["cities"])
     return render_template("9-states.html", state=states)
 
 
 @app.route("/states/<id>", strict_slashes=False)
 def states_id(id):
     """Renders an HTML page with information about the state with the given <id>, if it exists."""
-    for state in storage.all("State").values():
-        if state.id == id:
-            return render_template("9-states.html", state=state)
+    state = storage.get("State", id)
+    if state is not None:
+        return render_template("9-states.html", state=state)
     return render_template("9-states.html")
 
 